@@ -1,16 +1,25 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
+import json
 import os
-import shutil
 import threading
-from pathlib import Path
+
+from organizer_engine import (
+    DEFAULT_SCAN_THREADS, DEFAULT_WORKERS, MAX_WORKERS, FolderFilter, KeywordSyntaxError,
+    ProgressCounter, RunJournal, ScanPlan, check_rules, describe_rule_problems, format_bytes, format_duration,
+    load_rules, make_config, open_watcher, run_operation, save_rules)
+
 
 class FileOrganizerApp:
     def __init__(self, master):
         self.master = master
-        self.keyword_rows = []
         self.operation_cancelled = False
         self.operation_running = False
+        self.progress_counter = None
+        self.last_plan = None
+        self.watcher = None
+        # Table rows of the rules in the last validated config, for hit counts
+        self.rule_items = None
         self.help_visible = False
         self.setup_ui()
 
@@ -19,7 +28,7 @@ class FileOrganizerApp:
         
         # Set window size
         window_width = 550
-        window_height = 670
+        window_height = 745
         
         # Get screen dimensions
         screen_width = self.master.winfo_screenwidth()
@@ -70,6 +79,18 @@ class FileOrganizerApp:
         mode_frame.grid(row=current_row, column=0, columnspan=2, sticky="w", padx=5, pady=2)
         ttk.Radiobutton(mode_frame, text="Copy Files (Safe)", variable=self.operation_mode, value="copy").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(mode_frame, text="Move Files", variable=self.operation_mode, value="move").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(mode_frame, text="Hardlink", variable=self.operation_mode, value="hardlink").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(mode_frame, text="Symlink", variable=self.operation_mode, value="symlink").pack(side=tk.LEFT, padx=5)
+        current_row += 1
+        
+        # What to do when an identical file is already in the destination (copy mode)
+        self.dedup = tk.StringVar(value="off")
+        dedup_frame = ttk.Frame(main_frame)
+        dedup_frame.grid(row=current_row, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+        ttk.Label(dedup_frame, text="Identical files (copy):").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(dedup_frame, text="Copy anyway", variable=self.dedup, value="off").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(dedup_frame, text="Skip", variable=self.dedup, value="skip").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(dedup_frame, text="Hardlink", variable=self.dedup, value="hardlink").pack(side=tk.LEFT, padx=5)
         current_row += 1
         
         # Search depth option
@@ -78,6 +99,37 @@ class FileOrganizerApp:
         search_frame.grid(row=current_row, column=0, columnspan=2, sticky="w", padx=5, pady=2)
         ttk.Checkbutton(search_frame, text="Include subfolders (search recursively)", 
                        variable=self.include_subfolders).pack(side=tk.LEFT, padx=5)
+        
+        # Number of parallel transfer workers
+        self.workers = tk.StringVar(value=str(DEFAULT_WORKERS))
+        ttk.Label(search_frame, text="Workers:").pack(side=tk.LEFT, padx=(20, 2))
+        ttk.Spinbox(search_frame, from_=1, to=MAX_WORKERS, width=4,
+                    textvariable=self.workers).pack(side=tk.LEFT)
+        
+        # Number of folders listed at once
+        self.scan_threads = tk.StringVar(value=str(DEFAULT_SCAN_THREADS))
+        ttk.Label(search_frame, text="Scan threads:").pack(side=tk.LEFT, padx=(10, 2))
+        ttk.Spinbox(search_frame, from_=1, to=MAX_WORKERS, width=4,
+                    textvariable=self.scan_threads).pack(side=tk.LEFT)
+        current_row += 1
+        
+        # Folders the search never enters
+        self.skip_hidden = tk.BooleanVar(value=True)
+        exclude_frame = ttk.Frame(main_frame)
+        exclude_frame.grid(row=current_row, column=0, columnspan=2, sticky="ew", padx=5, pady=2)
+        ttk.Checkbutton(exclude_frame, text="Skip hidden/system folders", 
+                       variable=self.skip_hidden).pack(side=tk.LEFT, padx=5)
+        ttk.Label(exclude_frame, text="Exclude:").pack(side=tk.LEFT, padx=(10, 2))
+        self.exclude_entry = ttk.Entry(exclude_frame)
+        self.exclude_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        current_row += 1
+        
+        # Incremental runs
+        self.incremental = tk.BooleanVar(value=False)
+        incremental_frame = ttk.Frame(main_frame)
+        incremental_frame.grid(row=current_row, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+        ttk.Checkbutton(incremental_frame, text="Skip files unchanged since the last run (incremental)", 
+                       variable=self.incremental).pack(side=tk.LEFT, padx=5)
         current_row += 1
 
         # Separator
@@ -95,47 +147,47 @@ class FileOrganizerApp:
         # Help window will be created as separate Toplevel when needed
         self.help_window = None
 
-        # Keywords section header
-        header_frame = ttk.Frame(main_frame)
-        header_frame.grid(row=current_row, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
-        ttk.Label(header_frame, text="Keywords", font=('Arial', 9, 'bold')).pack(side=tk.LEFT, padx=5)
-        ttk.Label(header_frame, text="Folder Name", font=('Arial', 9, 'bold')).pack(side=tk.LEFT, padx=150)
-        current_row += 1
-
-        # Scrollable frame for keyword rows
-        scroll_container = ttk.Frame(main_frame)
-        scroll_container.grid(row=current_row, column=0, columnspan=2, sticky="nsew", padx=5, pady=2)
-        
-        # Create canvas with scrollbar
-        self.canvas = tk.Canvas(scroll_container, height=87, bg="white", highlightthickness=1, highlightbackground="#cccccc")
-        scrollbar = ttk.Scrollbar(scroll_container, orient="vertical", command=self.canvas.yview)
-        self.keyword_container = ttk.Frame(self.canvas)
-        
-        self.keyword_container.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.keyword_container, anchor="nw", width=500)
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # Rule table: one Treeview row per rule, edited in place, so
+        # hundreds of rules cost no more widgets than three
+        table_frame = ttk.Frame(main_frame)
+        table_frame.grid(row=current_row, column=0, columnspan=2, sticky="nsew", padx=5, pady=2)
+        
+        self.rule_table = ttk.Treeview(table_frame, columns=("keyword", "folder", "hits"), show="headings",
+                                       height=4, selectmode="extended")
+        self.rule_table.heading("keyword", text="Keywords", anchor="w")
+        self.rule_table.heading("folder", text="Folder Name", anchor="w")
+        self.rule_table.heading("hits", text="Hits", anchor="e")
+        self.rule_table.column("keyword", width=270)
+        self.rule_table.column("folder", width=170)
+        self.rule_table.column("hits", width=55, anchor="e", stretch=False)
+        self.rule_table.tag_configure("invalid", background="#ffcdd2")
+        
+        # Scrolling would leave an open cell editor behind
+        scrollbar = ttk.Scrollbar(table_frame, orient="vertical",
+                                  command=lambda *args: (self.finish_rule_edit(), self.rule_table.yview(*args)))
+        self.rule_table.configure(yscrollcommand=scrollbar.set)
+        self.rule_table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Bind mousewheel for scrolling
-        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
-        self.keyword_container.bind("<MouseWheel>", self._on_mousewheel)
-        
+        self.rule_table.bind("<Double-1>", self.on_rule_double_click)
+        self.rule_table.bind("<Return>", lambda e: self.edit_selected_rule())
+        self.rule_table.bind("<Delete>", lambda e: self.remove_keyword_rows())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.rule_table.bind(sequence, lambda e: self.finish_rule_edit(), add="+")
+        self.rule_editor = None
         current_row += 1
 
         # Create initial 3 rows
         for i in range(3):
-            self.add_keyword_row()
+            self.add_keyword_row(edit=False)
 
-        # Add row button
+        # Rule buttons
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=current_row, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
         ttk.Button(button_frame, text="+ Add Row", command=self.add_keyword_row).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Remove", command=self.remove_keyword_rows).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export...", command=self.export_rules).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Import...", command=self.import_rules).pack(side=tk.RIGHT, padx=5)
         current_row += 1
 
         # Separator
@@ -154,6 +206,14 @@ class FileOrganizerApp:
                                        bg="green", fg="white", height=2, font=('Arial', 10, 'bold'))
         self.execute_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         
+        self.resume_button = tk.Button(action_frame, text="Resume", command=self.resume_operation, 
+                                      bg="#6a1b9a", fg="white", height=2, font=('Arial', 10, 'bold'))
+        self.resume_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        
+        self.watch_button = tk.Button(action_frame, text="Watch", command=self.watch_operation, 
+                                     bg="#00796b", fg="white", height=2, font=('Arial', 10, 'bold'))
+        self.watch_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        
         self.cancel_button = tk.Button(action_frame, text="Cancel", command=self.cancel_operation, 
                                       bg="#ffeb3b", fg="black", height=2, font=('Arial', 10, 'bold'), state=tk.DISABLED)
         self.cancel_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
@@ -181,10 +241,6 @@ class FileOrganizerApp:
         self.progress_percent = ttk.Label(main_frame, text="0%")
         self.progress_percent.grid(row=current_row, column=0, columnspan=2)
 
-    def _on_mousewheel(self, event):
-        """Handle mousewheel scrolling for keyword canvas"""
-        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-
     def toggle_help(self):
         """Toggle help section visibility as separate window"""
         if self.help_visible:
@@ -221,12 +277,26 @@ class FileOrganizerApp:
 
 • NOT operator (!): "apple ! red" - matches files with "apple" but NOT "red"
 
+• Grouping: "(jpg | png) * 2024" - parentheses group parts of an expression
+
+• Quotes: '"(1)"' - text in double quotes is matched literally
+
+• File details: "ext:jpg" (or "ext:jpg,png"), "size>5MB", "age<30d",
+  "mtime>=2024-01-01" and "dir:camera" (folder below the source) test the
+  file instead of its name. Sizes take B/KB/MB/GB/TB, ages s/min/h/d/w/mo/y.
+  A date means the whole day: "mtime=2024-01-01" is any time on that day.
+
 Examples:
   "photo * 2024" → matches "vacation_photo_2024.jpg"
   "jpg | png" → matches both .jpg and .png files
   "report ! draft" → matches "final_report.pdf" but not "draft_report.pdf"
+  "ext:mp4 * size>500MB" → matches large .mp4 videos
+
+Double-click a cell (or press Enter) to edit a rule; Tab moves to the next cell. Import... and Export... read and write rule lists as CSV (keyword,folder) or JSON. After a run, Hits shows how many files each rule matched.
+
+Hardlink and Symlink modes leave every file where it is and only add a link to it in its keyword folder, so no data is copied. Hardlinks need the target on the same drive as the source; elsewhere the file is copied instead.
 
-You can combine operators in your keywords to create powerful search patterns. The matching is case-insensitive and works on both the filename and file extension.
+You can combine operators in your keywords to create powerful search patterns. ! binds tightest, then *, then |, so "photo * 2024 | scan ! draft" means (photo AND 2024) OR (scan but NOT draft). The matching is case-insensitive and works on both the filename and file extension.
 """
             help_text.insert("1.0", help_content)
             help_text.config(state=tk.DISABLED)
@@ -237,77 +307,174 @@ You can combine operators in your keywords to create powerful search patterns. T
             self.help_toggle_btn.config(text="▼ Hide Keyword Help")
             self.help_visible = True
 
-    def bind_mousewheel_to_row(self, row):
-        """Bind mousewheel to all widgets in a row"""
-        row['frame'].bind("<MouseWheel>", self._on_mousewheel)
-        row['keyword'].bind("<MouseWheel>", self._on_mousewheel)
-        row['folder'].bind("<MouseWheel>", self._on_mousewheel)
-        row['remove_btn'].bind("<MouseWheel>", self._on_mousewheel)
-
-    def add_keyword_row(self):
-        """Add a new keyword/folder row - NO LIMIT"""
-        row_frame = ttk.Frame(self.keyword_container)
-        row_frame.pack(fill=tk.X, pady=2, padx=5)
-        
-        keyword_entry = ttk.Entry(row_frame, width=35)
-        keyword_entry.pack(side=tk.LEFT, padx=2)
-        keyword_entry.insert(0, "e.g., photo * 2024")
-        keyword_entry.config(foreground='grey')
-        keyword_entry.bind("<FocusIn>", lambda e: self.on_entry_click(keyword_entry, "e.g., photo * 2024"))
-        keyword_entry.bind("<FocusOut>", lambda e: self.on_focusout(keyword_entry, "e.g., photo * 2024"))
-        
-        folder_entry = ttk.Entry(row_frame, width=33)
-        folder_entry.pack(side=tk.LEFT, padx=2)
-        folder_entry.insert(0, "Folder name")
-        folder_entry.config(foreground='grey')
-        folder_entry.bind("<FocusIn>", lambda e: self.on_entry_click(folder_entry, "Folder name"))
-        folder_entry.bind("<FocusOut>", lambda e: self.on_focusout(folder_entry, "Folder name"))
-        
-        remove_btn = ttk.Button(row_frame, text="Remove", width=8, 
-                               command=lambda: self.remove_keyword_row(row_frame))
-        remove_btn.pack(side=tk.LEFT, padx=2)
-        
-        self.keyword_rows.append({
-            'frame': row_frame,
-            'keyword': keyword_entry,
-            'folder': folder_entry,
-            'remove_btn': remove_btn
-        })
-        
-        # Bind mousewheel to row widgets
-        self.bind_mousewheel_to_row(self.keyword_rows[-1])
-        
-        # Update canvas scroll region
-        self.canvas.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
-    def on_entry_click(self, entry, placeholder):
-        """Clear placeholder on focus"""
-        if entry.get() == placeholder:
-            entry.delete(0, tk.END)
-            entry.config(foreground='black')
-
-    def on_focusout(self, entry, placeholder):
-        """Restore placeholder if empty"""
-        if entry.get() == '':
-            entry.insert(0, placeholder)
-            entry.config(foreground='grey')
-
-    def remove_keyword_row(self, frame):
-        """Remove a keyword row"""
-        if len(self.keyword_rows) <= 1:
-            messagebox.showwarning("Warning", "At least one row must remain")
+    def add_keyword_row(self, keyword="", folder="", edit=True):
+        """Add a keyword/folder row - NO LIMIT"""
+        self.finish_rule_edit()
+        item = self.rule_table.insert("", tk.END, values=(keyword, folder, ""))
+        if edit:
+            self.rule_table.selection_set(item)
+            self.begin_rule_edit(item, "#1")
+        return item
+
+    def remove_keyword_rows(self):
+        """Remove the selected rows, keeping one empty row at least"""
+        self.finish_rule_edit(save=False)
+        selected = self.rule_table.selection()
+        if not selected:
+            messagebox.showinfo("Remove", "Select the rows to remove first")
+            return
+        self.rule_table.delete(*selected)
+        if not self.rule_table.get_children():
+            self.add_keyword_row(edit=False)
+
+    def on_rule_double_click(self, event):
+        """Edit the keyword or folder cell that was double-clicked"""
+        if self.rule_table.identify_region(event.x, event.y) != "cell":
+            return
+        item = self.rule_table.identify_row(event.y)
+        column = self.rule_table.identify_column(event.x)
+        # Hits are filled in by runs, not typed
+        if item and column in ("#1", "#2"):
+            self.begin_rule_edit(item, column)
+
+    def edit_selected_rule(self):
+        selected = self.rule_table.selection()
+        if selected:
+            self.begin_rule_edit(selected[0], "#1")
+
+    def begin_rule_edit(self, item, column):
+        """Open an entry over one cell; Enter or leaving it saves, Escape cancels"""
+        self.finish_rule_edit()
+        self.rule_table.see(item)
+        self.rule_table.update_idletasks()
+        bbox = self.rule_table.bbox(item, column)
+        if not bbox:
+            return
+        x, y, width, height = bbox
+        editor = ttk.Entry(self.rule_table)
+        editor.insert(0, self.rule_table.set(item, column))
+        editor.select_range(0, tk.END)
+        editor.place(x=x, y=y, width=width, height=height)
+        editor.focus_set()
+        editor.bind("<Return>", lambda e: self.finish_rule_edit(refocus=True))
+        editor.bind("<Escape>", lambda e: self.finish_rule_edit(save=False, refocus=True))
+        editor.bind("<FocusOut>", lambda e: self.finish_rule_edit())
+        editor.bind("<Tab>", lambda e: self.edit_next_rule_cell())
+        self.rule_editor = (editor, item, column)
+
+    def edit_next_rule_cell(self):
+        """Tab from keyword to folder, and from folder to the next row"""
+        if self.rule_editor is None:
+            return "break"
+        _, item, column = self.rule_editor
+        self.finish_rule_edit()
+        if column == "#1":
+            self.begin_rule_edit(item, "#2")
+        else:
+            next_item = self.rule_table.next(item) or self.add_keyword_row(edit=False)
+            self.rule_table.selection_set(next_item)
+            self.begin_rule_edit(next_item, "#1")
+        return "break"
+
+    def finish_rule_edit(self, save=True, refocus=False):
+        """Close the open cell editor, if any, keeping its text unless save is False"""
+        if self.rule_editor is None:
+            return
+        editor, item, column = self.rule_editor
+        self.rule_editor = None
+        if save and self.rule_table.exists(item):
+            value = editor.get().strip()
+            if value != self.rule_table.set(item, column):
+                self.rule_table.set(item, column, value)
+                # Edited rules are checked again and have no hits yet
+                self.rule_table.set(item, "hits", "")
+                self.rule_table.item(item, tags=())
+        editor.destroy()
+        if refocus:
+            self.rule_table.focus_set()
+
+    def read_rule_table(self):
+        """(item, keyword, folder) for every row that is not blank"""
+        rows = []
+        for item in self.rule_table.get_children():
+            keyword, folder = self.rule_table.set(item, "keyword"), self.rule_table.set(item, "folder")
+            if keyword or folder:
+                rows.append((item, keyword, folder))
+        return rows
+
+    def check_rule_table(self):
+        """
+        Check every rule in one pass, marking the bad rows; returns
+        (pairs, items) or None after reporting the problems.
+        """
+        self.finish_rule_edit()
+        rows = self.read_rule_table()
+        items = [item for item, _, _ in rows]
+        pairs = [(keyword, folder) for _, keyword, folder in rows]
+        problems = check_rules(pairs)
+        
+        bad = {index for index, _ in problems}
+        for index, item in enumerate(items):
+            self.rule_table.item(item, tags=("invalid",) if index in bad else ())
+        if problems:
+            # Number rules by table row, blank rows included
+            children = self.rule_table.get_children()
+            problems = [(children.index(items[index]), message) for index, message in problems]
+            self.rule_table.see(children[problems[0][0]])
+            messagebox.showerror("Invalid Rules", describe_rule_problems(problems))
+            return None
+        return pairs, items
+
+    def import_rules(self):
+        """Load rules from a CSV or JSON file into the table"""
+        path = filedialog.askopenfilename(filetypes=[("Rule files", "*.csv *.json"), ("CSV", "*.csv"),
+                                                     ("JSON", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            pairs = load_rules(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not import the rules:\n{str(e)}")
+            return
+        if not pairs:
+            messagebox.showinfo("Import", f"No rules found in:\n{path}")
             return
         
-        for row in self.keyword_rows:
-            if row['frame'] == frame:
-                row['frame'].destroy()
-                self.keyword_rows.remove(row)
-                break
-        
-        # Update canvas scroll region
-        self.canvas.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.finish_rule_edit(save=False)
+        if self.read_rule_table():
+            answer = messagebox.askyesnocancel("Import", "Replace the current rules?\n\n"
+                                               "Yes: replace them\nNo: add the imported rules after them")
+            if answer is None:
+                return
+            if answer:
+                self.rule_table.delete(*self.rule_table.get_children())
+        else:
+            self.rule_table.delete(*self.rule_table.get_children())
+        for keyword, folder in pairs:
+            self.add_keyword_row(keyword, folder, edit=False)
+        self.check_rule_table()
+
+    def export_rules(self):
+        """Save the rules in the table as CSV or JSON"""
+        self.finish_rule_edit()
+        pairs = [(keyword, folder) for _, keyword, folder in self.read_rule_table()]
+        if not pairs:
+            messagebox.showinfo("Export", "There are no rules to export")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".csv", initialfile="rules.csv",
+                                            filetypes=[("CSV", "*.csv"), ("JSON", "*.json")])
+        if not path:
+            return
+        try:
+            save_rules(path, pairs)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the rules:\n{str(e)}")
+
+    def show_rule_hits(self, items, hits):
+        """Fill the Hits column from a run's per-rule match counts"""
+        for item, count in zip(items, hits):
+            if self.rule_table.exists(item):
+                self.rule_table.set(item, "hits", count)
 
     def browse_folder(self, entry_widget):
         """Browse for folder"""
@@ -328,21 +495,32 @@ You can combine operators in your keywords to create powerful search patterns. T
         
         # Reset operation mode
         self.operation_mode.set("copy")
+        self.dedup.set("off")
+        self.workers.set(str(DEFAULT_WORKERS))
+        self.scan_threads.set(str(DEFAULT_SCAN_THREADS))
+        self.skip_hidden.set(True)
+        self.exclude_entry.delete(0, tk.END)
+        self.incremental.set(False)
         
         # Clear all keyword rows
-        for row in self.keyword_rows[:]:
-            row['frame'].destroy()
-        self.keyword_rows.clear()
+        self.finish_rule_edit(save=False)
+        self.rule_table.delete(*self.rule_table.get_children())
+        self.rule_items = None
         
         # Create fresh 3 rows
         for i in range(3):
-            self.add_keyword_row()
+            self.add_keyword_row(edit=False)
         
         # Reset progress
         self.progress['value'] = 0
         self.progress_percent['text'] = "0%"
         self.progress_label['text'] = "Ready"
         
+        # Forget any previewed plan
+        if self.last_plan is not None:
+            self.last_plan.discard()
+        self.last_plan = None
+        
         # Reset flags
         self.operation_cancelled = False
         self.operation_running = False
@@ -350,81 +528,42 @@ You can combine operators in your keywords to create powerful search patterns. T
         # Enable buttons
         self.execute_button.config(state=tk.NORMAL)
         self.preview_button.config(state=tk.NORMAL)
+        self.resume_button.config(state=tk.NORMAL)
         self.reset_button.config(state=tk.NORMAL)
         self.cancel_button.config(state=tk.DISABLED)
 
-    def match_keyword(self, filename, keyword):
-        """
-        Match filename against keyword with operators
-        * = AND
-        | = OR
-        ! = NOT
-        """
-        filename_lower = filename.lower()
-        keyword_lower = keyword.lower()
-        
-        # Handle NOT operator (!)
-        if '!' in keyword_lower:
-            parts = keyword_lower.split('!')
-            if len(parts) == 2:
-                must_have = parts[0].strip()
-                must_not_have = parts[1].strip()
-                return must_have in filename_lower and must_not_have not in filename_lower
-        
-        # Handle OR operator (|)
-        if '|' in keyword_lower:
-            parts = keyword_lower.split('|')
-            return any(part.strip() in filename_lower for part in parts)
-        
-        # Handle AND operator (*)
-        if '*' in keyword_lower:
-            parts = keyword_lower.split('*')
-            return all(part.strip() in filename_lower for part in parts)
-        
-        # Simple keyword match
-        return keyword_lower in filename_lower
-
     def validate_inputs(self):
         """Validate user inputs before operation"""
         source_path = self.source_entry.get().strip()
+        target_path = self.target_entry.get().strip()
         
-        if not source_path:
-            messagebox.showerror("Error", "Please select a source folder")
-            return None
-        
-        if not os.path.exists(source_path):
-            messagebox.showerror("Error", f"Source folder does not exist:\n{source_path}")
-            return None
-        
-        if not os.path.isdir(source_path):
-            messagebox.showerror("Error", "Source path must be a directory")
+        # Get valid keyword/folder pairs (skip blank rows)
+        checked = self.check_rule_table()
+        if checked is None:
             return None
+        valid_pairs, self.rule_items = checked
         
-        target_path = self.target_entry.get().strip()
-        if not target_path:
-            target_path = source_path
-        
-        # Get valid keyword/folder pairs (skip placeholders)
-        valid_pairs = []
-        for row in self.keyword_rows:
-            keyword = row['keyword'].get().strip()
-            folder = row['folder'].get().strip()
-            
-            # Skip if empty or still has placeholder text
-            if keyword and folder and keyword != "e.g., photo * 2024" and folder != "Folder name":
-                valid_pairs.append((keyword, folder))
+        try:
+            workers = int(self.workers.get())
+        except ValueError:
+            workers = 0
+        try:
+            scan_threads = int(self.scan_threads.get())
+        except ValueError:
+            scan_threads = 0
         
-        if not valid_pairs:
-            messagebox.showerror("Error", "Please enter at least one keyword and folder name pair")
+        try:
+            return make_config(source_path, target_path, valid_pairs, mode=self.operation_mode.get(),
+                               include_subfolders=self.include_subfolders.get(),
+                               skip_hidden=self.skip_hidden.get(),
+                               exclude=FolderFilter.parse_patterns(self.exclude_entry.get()),
+                               incremental=self.incremental.get(), dedup=self.dedup.get(),
+                               workers=workers, scan_threads=scan_threads)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return None
-        
-        return {
-            'source': source_path,
-            'target': target_path,
-            'pairs': valid_pairs,
-            'mode': self.operation_mode.get(),
-            'include_subfolders': self.include_subfolders.get()
-        }
+
+    PREVIEW_POLL_MS = 150
 
     def preview_operation(self):
         """Show preview of what files will be moved/copied"""
@@ -439,205 +578,251 @@ You can combine operators in your keywords to create powerful search patterns. T
         ttk.Label(preview_window, text=f"Operation: {config['mode'].upper()}", 
                  font=('Arial', 10, 'bold')).pack(pady=5)
         
+        status_label = ttk.Label(preview_window, text="Scanning...")
+        status_label.pack()
+        
         text_area = scrolledtext.ScrolledText(preview_window, wrap=tk.WORD, width=70, height=20)
         text_area.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
         
-        # Scan files
-        file_matches = {}
-        unmatched_files = []
+        # Scan files in the background so the window stays responsive
+        plan = ScanPlan(config)
+        cancelled = threading.Event()
         
-        try:
-            if config['include_subfolders']:
-                # Search recursively in all subfolders
-                for root, _, files in os.walk(config['source']):
-                    for filename in files:
-                        matched = False
-                        for keyword, folder_name in config['pairs']:
-                            if self.match_keyword(filename, keyword):
-                                if folder_name not in file_matches:
-                                    file_matches[folder_name] = []
-                                file_matches[folder_name].append(filename)
-                                matched = True
-                                break
-                        
-                        if not matched:
-                            unmatched_files.append(filename)
-            else:
-                # Search only in the source folder (not subfolders)
-                try:
-                    files = [f for f in os.listdir(config['source']) 
-                            if os.path.isfile(os.path.join(config['source'], f))]
-                    for filename in files:
-                        matched = False
-                        for keyword, folder_name in config['pairs']:
-                            if self.match_keyword(filename, keyword):
-                                if folder_name not in file_matches:
-                                    file_matches[folder_name] = []
-                                file_matches[folder_name].append(filename)
-                                matched = True
-                                break
-                        
-                        if not matched:
-                            unmatched_files.append(filename)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Error reading source folder:\n{str(e)}")
-                    preview_window.destroy()
-                    return
-            
-            # Display results
-            if file_matches:
-                for folder_name, files in file_matches.items():
-                    text_area.insert(tk.END, f"\n📁 {folder_name} ({len(files)} files):\n", 'header')
-                    for f in files[:10]:
-                        text_area.insert(tk.END, f"   • {f}\n")
-                    if len(files) > 10:
-                        text_area.insert(tk.END, f"   ... and {len(files) - 10} more files\n")
-            else:
-                text_area.insert(tk.END, "No files match the given keywords.\n")
-            
-            if unmatched_files:
-                text_area.insert(tk.END, f"\n⚠️  {len(unmatched_files)} files won't be processed (no keyword match)\n")
-            
-            text_area.config(state=tk.DISABLED)
-            
-        except Exception as e:
-            messagebox.showerror("Preview Error", f"Error during preview:\n{str(e)}")
+        def close_preview():
+            cancelled.set()
             preview_window.destroy()
+        preview_window.protocol("WM_DELETE_WINDOW", close_preview)
+        
+        thread = threading.Thread(target=plan.build, args=(config, cancelled.is_set))
+        thread.daemon = True
+        thread.start()
+        
+        self.master.after(self.PREVIEW_POLL_MS, lambda: self.refresh_preview(
+            plan, cancelled, preview_window, status_label, text_area))
+
+    def refresh_preview(self, plan, cancelled, preview_window, status_label, text_area):
+        """Redraw the preview from the plan until its scan finishes"""
+        if cancelled.is_set() or not preview_window.winfo_exists():
+            return
+        
+        if plan.error is not None:
+            messagebox.showerror("Error", f"Error reading source folder:\n{str(plan.error)}")
+            preview_window.destroy()
+            cancelled.set()
+            return
+        
+        complete = plan.complete
+        folder_counts, samples, unmatched = plan.snapshot()
+        
+        # Display results
+        text_area.config(state=tk.NORMAL)
+        text_area.delete("1.0", tk.END)
+        if folder_counts:
+            for folder_name, count in folder_counts.items():
+                text_area.insert(tk.END, f"\n📁 {folder_name} ({count} files):\n", 'header')
+                for f in samples[folder_name]:
+                    text_area.insert(tk.END, f"   • {f}\n")
+                if count > len(samples[folder_name]):
+                    text_area.insert(tk.END, f"   ... and {count - len(samples[folder_name])} more files\n")
+        elif complete:
+            text_area.insert(tk.END, "No files match the given keywords.\n")
+        
+        if unmatched:
+            text_area.insert(tk.END, f"\n⚠️  {unmatched} files won't be processed (no keyword match)\n")
+        
+        if plan.scan_errors:
+            text_area.insert(tk.END, f"\n❌ {len(plan.scan_errors)} folders could not be read\n")
+        text_area.config(state=tk.DISABLED)
+        
+        matched = sum(folder_counts.values())
+        if not complete:
+            status_label['text'] = f"Scanning... {matched} matching files so far"
+            self.master.after(self.PREVIEW_POLL_MS, lambda: self.refresh_preview(
+                plan, cancelled, preview_window, status_label, text_area))
+            return
+        
+        # Execute applies this plan as long as the inputs stay the same
+        if self.last_plan is not None:
+            self.last_plan.discard()
+        self.last_plan = plan
+        status_label['text'] = f"Scan complete - Execute will use this preview ({matched} files)"
 
     def cancel_operation(self):
         """Cancel ongoing operation"""
+        if self.watcher is not None and not self.watcher.stopped.is_set():
+            # Stop watching, but let transfers already started finish
+            self.watcher.stop()
+            self.progress_label['text'] = "Stopping watch..."
+            return
         self.operation_cancelled = True
         self.progress_label['text'] = "Cancelling..."
 
+    PROGRESS_POLL_MS = 100
+
     def execute(self):
         """Execute file organization in a separate thread"""
         config = self.validate_inputs()
         if not config:
             return
         
+        if RunJournal.exists(config['target']):
+            answer = messagebox.askyesnocancel(
+                "Interrupted Run",
+                "An interrupted run was found in the target folder.\n\n"
+                "Yes: resume it\nNo: discard it and start a new run")
+            if answer is None:
+                return
+            if answer:
+                self.resume_operation()
+                return
+        
+        # Reuse the previewed plan if nothing changed since; either way it
+        # is stale once files have been transferred
+        plan = self.last_plan if self.last_plan is not None and self.last_plan.matches_config(config) else None
+        if plan is None and self.last_plan is not None:
+            self.last_plan.discard()
+        self.last_plan = None
+        self.start_operation(config, plan=plan)
+
+    def resume_operation(self):
+        """Finish an interrupted run from the journal in its target folder"""
+        target = self.target_entry.get().strip() or self.source_entry.get().strip()
+        if not target:
+            messagebox.showerror("Error", "Please select the target folder of the interrupted run")
+            return
+        
+        try:
+            state = RunJournal.load(target)
+            if state is not None:
+                config = state.config()
+        except (OSError, KeyError, KeywordSyntaxError) as e:
+            messagebox.showerror("Error", f"Could not read the run journal:\n{str(e)}")
+            return
+        if state is None:
+            messagebox.showinfo("Resume", f"No interrupted run found in:\n{target}")
+            return
+        # The journal's rules need not be the ones in the table
+        self.rule_items = None
+        
+        try:
+            config['workers'] = max(1, min(int(self.workers.get()), MAX_WORKERS))
+        except ValueError:
+            config['workers'] = DEFAULT_WORKERS
+        try:
+            config['scan_threads'] = max(1, min(int(self.scan_threads.get()), MAX_WORKERS))
+        except ValueError:
+            pass
+        self.start_operation(config, resume=state)
+
+    def watch_operation(self):
+        """Sort the files in the source, then keep sorting new ones until stopped"""
+        config = self.validate_inputs()
+        if not config:
+            return
+        
+        if RunJournal.exists(config['target']):
+            messagebox.showwarning("Interrupted Run",
+                                   "An interrupted run was found in the target folder.\n\n"
+                                   "Resume it, or discard it with Execute, before watching.")
+            return
+        
+        try:
+            self.watcher = open_watcher(config['source'], config['include_subfolders'], prune=config['prune'])
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot watch the source folder:\n{str(e)}")
+            return
+        self.start_operation(config, watcher=self.watcher)
+
+    def start_operation(self, config, plan=None, resume=None, watcher=None):
+        """Run perform_file_operations in a background thread"""
         # Disable buttons during operation
         self.execute_button.config(state=tk.DISABLED)
         self.preview_button.config(state=tk.DISABLED)
+        self.resume_button.config(state=tk.DISABLED)
+        self.watch_button.config(state=tk.DISABLED)
         self.reset_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
         
         self.operation_running = True
         self.operation_cancelled = False
+        self.progress_counter = ProgressCounter()
         
         # Run in thread
-        thread = threading.Thread(target=self.perform_file_operations, args=(config,))
+        thread = threading.Thread(target=self.perform_file_operations,
+                                  args=(config, self.progress_counter, plan, resume, watcher))
         thread.daemon = True
         thread.start()
+        self.poll_progress()
 
-    def perform_file_operations(self, config):
-        """Perform the actual file operations"""
-        operation_log = {
-            'success': {},
-            'errors': [],
-            'skipped': [],
-            'total_processed': 0
-        }
-        
+    def poll_progress(self):
+        """Refresh the progress display from the shared counter while running"""
+        self.update_progress(self.progress_counter.snapshot())
+        if self.operation_running:
+            self.master.after(self.PROGRESS_POLL_MS, self.poll_progress)
+
+    def perform_file_operations(self, config, progress, plan=None, resume=None, watcher=None):
+        """Run the engine in this background thread and report how it ended"""
         try:
-            # Collect all matching files first
-            files_to_process = []
+            outcome = run_operation(config, progress, lambda: self.operation_cancelled,
+                                    plan=plan, resume=resume, watcher=watcher)
             
-            if config['include_subfolders']:
-                # Search recursively in all subfolders
-                for root, _, files in os.walk(config['source']):
-                    for filename in files:
-                        file_path = os.path.join(root, filename)
-                        
-                        for keyword, folder_name in config['pairs']:
-                            if self.match_keyword(filename, keyword):
-                                files_to_process.append((file_path, filename, folder_name))
-                                break
-            else:
-                # Search only in the source folder (not subfolders)
-                try:
-                    files = [f for f in os.listdir(config['source']) 
-                            if os.path.isfile(os.path.join(config['source'], f))]
-                    for filename in files:
-                        file_path = os.path.join(config['source'], filename)
-                        
-                        for keyword, folder_name in config['pairs']:
-                            if self.match_keyword(filename, keyword):
-                                files_to_process.append((file_path, filename, folder_name))
-                                break
-                except Exception as e:
-                    self.master.after(0, lambda: messagebox.showerror("Error", f"Error reading source folder:\n{str(e)}"))
-                    self.master.after(0, self.reset_ui_after_operation)
-                    return
-            
-            total_files = len(files_to_process)
-            
-            if total_files == 0:
+            rule_items = self.rule_items
+            if rule_items is not None and outcome.status in ('completed', 'no_matches'):
+                self.master.after(0, lambda: self.show_rule_hits(rule_items, outcome.log['rule_hits']))
+            if outcome.status == 'cancelled':
+                self.master.after(0, lambda: messagebox.showinfo("Cancelled", "Operation cancelled by user."))
+            elif outcome.status == 'scan_failed':
+                error = outcome.error
+                self.master.after(0, lambda: messagebox.showerror("Error", f"Error reading source folder:\n{str(error)}"))
+            elif outcome.status == 'nothing_new':
+                self.master.after(0, lambda: messagebox.showinfo(
+                    "Nothing New", "No new or changed files matched since the last run."))
+            elif outcome.status == 'no_matches':
                 self.master.after(0, lambda: messagebox.showinfo("No Matches", "No files matched the given keywords."))
-                self.master.after(0, self.reset_ui_after_operation)
-                return
-            
-            # Process files
-            for idx, (file_path, filename, folder_name) in enumerate(files_to_process):
-                if self.operation_cancelled:
-                    self.master.after(0, lambda: messagebox.showinfo("Cancelled", "Operation cancelled by user."))
-                    self.master.after(0, self.reset_ui_after_operation)
-                    return
-                
-                try:
-                    # Create destination folder (auto-create if doesn't exist)
-                    dest_folder = os.path.join(config['target'], folder_name)
-                    os.makedirs(dest_folder, exist_ok=True)
-                    
-                    dest_path = os.path.join(dest_folder, filename)
-                    
-                    # Handle duplicate filenames
-                    if os.path.exists(dest_path):
-                        base, ext = os.path.splitext(filename)
-                        counter = 1
-                        while os.path.exists(dest_path):
-                            new_filename = f"{base}_{counter}{ext}"
-                            dest_path = os.path.join(dest_folder, new_filename)
-                            counter += 1
-                    
-                    # Perform operation
-                    if config['mode'] == 'copy':
-                        shutil.copy2(file_path, dest_path)
-                    else:
-                        shutil.move(file_path, dest_path)
-                    
-                    # Log success
-                    if folder_name not in operation_log['success']:
-                        operation_log['success'][folder_name] = 0
-                    operation_log['success'][folder_name] += 1
-                    operation_log['total_processed'] += 1
-                    
-                except Exception as e:
-                    operation_log['errors'].append(f"{filename}: {str(e)}")
-                
-                # Update progress
-                progress = int(((idx + 1) / total_files) * 100)
-                self.master.after(0, lambda p=progress, f=filename: self.update_progress(p, f))
-            
-            # Show summary
-            self.master.after(0, lambda: self.show_summary(operation_log, config['mode']))
+            else:
+                # Show summary
+                self.master.after(0, lambda: self.show_summary(outcome.log, config['mode']))
             
         except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Error", f"Operation failed:\n{str(e)}"))
+            error = e
+            self.master.after(0, lambda: messagebox.showerror("Error", f"Operation failed:\n{str(error)}"))
         
         finally:
             self.master.after(0, self.reset_ui_after_operation)
 
-    def update_progress(self, percent, filename):
-        """Update progress bar and label"""
-        self.progress['value'] = percent
-        self.progress_percent['text'] = f"{percent}%"
-        self.progress_label['text'] = f"Processing: {filename[:40]}..."
+    def update_progress(self, snapshot):
+        """Update progress bar and labels from a ProgressCounter snapshot"""
+        self.progress['value'] = snapshot['percent']
+        
+        details = [f"{snapshot['percent']}%",
+                   f"{snapshot['files_per_second']:.0f} files/s",
+                   f"{format_bytes(snapshot['bytes_per_second'])}/s"]
+        if snapshot['eta'] is not None and snapshot['done'] < snapshot['discovered']:
+            details.append(f"ETA {format_duration(snapshot['eta'])}")
+        self.progress_percent['text'] = "  •  ".join(details)
+        
+        if self.operation_cancelled:
+            return
+        if self.watcher is not None and snapshot['scanning'] and snapshot['done'] == snapshot['discovered']:
+            self.progress_label['text'] = f"Watching for new files... {snapshot['done']} sorted so far"
+            return
+        found = f"{snapshot['discovered']}+" if snapshot['scanning'] else f"{snapshot['discovered']}"
+        current = snapshot['current']
+        if current:
+            self.progress_label['text'] = f"Processing {snapshot['done']}/{found}: {current[:30]}..."
+        else:
+            self.progress_label['text'] = f"Scanning... {found} files found"
 
     def reset_ui_after_operation(self):
         """Reset UI state after operation completes"""
         self.operation_running = False
+        self.watcher = None
+        if self.progress_counter is not None:
+            self.update_progress(self.progress_counter.snapshot())
         self.execute_button.config(state=tk.NORMAL)
         self.preview_button.config(state=tk.NORMAL)
+        self.resume_button.config(state=tk.NORMAL)
+        self.watch_button.config(state=tk.NORMAL)
         self.reset_button.config(state=tk.NORMAL)
         self.cancel_button.config(state=tk.DISABLED)
 
@@ -655,11 +840,54 @@ You can combine operators in your keywords to create powerful search patterns. T
         
         text_area.insert(tk.END, f"✅ Total files processed: {log['total_processed']}\n\n")
         
+        if log.get('unchanged_skipped'):
+            text_area.insert(tk.END, f"⏩ Unchanged since the last run: {log['unchanged_skipped']} files\n\n")
+        
         if log['success']:
             text_area.insert(tk.END, "Files organized by folder:\n")
             for folder, count in log['success'].items():
                 text_area.insert(tk.END, f"  📁 {folder}: {count} files\n")
         
+        if log.get('duplicates'):
+            action = "hardlinked" if log['dedup'] == 'hardlink' else "skipped"
+            text_area.insert(tk.END, f"\n♻️ Identical files {action} ({len(log['duplicates'])}, "
+                                     f"{format_bytes(log['duplicate_bytes'])} not copied):\n")
+            for duplicate in log['duplicates'][:10]:
+                text_area.insert(tk.END, f"  • {duplicate}\n")
+            if len(log['duplicates']) > 10:
+                text_area.insert(tk.END, f"  ... and {len(log['duplicates']) - 10} more\n")
+        
+        if log.get('transfer_methods'):
+            text_area.insert(tk.END, "\nTransfer method used:\n")
+            for method, count in sorted(log['transfer_methods'].items(), key=lambda item: -item[1]):
+                text_area.insert(tk.END, f"  ⚙️ {method}: {count} files\n")
+        
+        if log.get('stats'):
+            stats = log['stats']
+            text_area.insert(tk.END, f"\n⏱️ Time by phase (run took {stats['wall_seconds']:.1f}s):\n")
+            for phase, totals in sorted(stats['phases'].items(), key=lambda item: -item[1]['seconds']):
+                text_area.insert(tk.END, f"  • {phase}: {totals['seconds']:.2f}s ({totals['count']})\n")
+            if 'transfer' in stats['phases']:
+                text_area.insert(tk.END, "  (transfer time is summed over all workers)\n")
+            counters = dict(stats['counters'], **stats['io'])
+            if counters:
+                text_area.insert(tk.END, "Counters:\n")
+                for counter, value in counters.items():
+                    value = format_bytes(value) if 'bytes' in counter else value
+                    text_area.insert(tk.END, f"  • {counter.replace('_', ' ')}: {value}\n")
+            if stats['slowest_files']:
+                text_area.insert(tk.END, "Slowest files:\n")
+                for slow in stats['slowest_files'][:5]:
+                    text_area.insert(tk.END, f"  • {os.path.basename(slow['path'])} "
+                                             f"({format_bytes(slow['bytes'])}): {slow['seconds']:.2f}s\n")
+        
+        if log['skipped']:
+            text_area.insert(tk.END, f"\n⏭️ Skipped ({len(log['skipped'])}):\n")
+            for skipped in log['skipped'][:10]:
+                text_area.insert(tk.END, f"  • {skipped}\n")
+            if len(log['skipped']) > 10:
+                text_area.insert(tk.END, f"  ... and {len(log['skipped']) - 10} more\n")
+        
         if log['errors']:
             text_area.insert(tk.END, f"\n❌ Errors ({len(log['errors'])}):\n")
             for error in log['errors'][:10]:
@@ -669,7 +897,23 @@ You can combine operators in your keywords to create powerful search patterns. T
         
         text_area.config(state=tk.DISABLED)
         
-        ttk.Button(summary_window, text="Close", command=summary_window.destroy).pack(pady=5)
+        button_frame = ttk.Frame(summary_window)
+        button_frame.pack(pady=5)
+        ttk.Button(button_frame, text="Export Report...",
+                   command=lambda: self.export_report(log, mode)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=summary_window.destroy).pack(side=tk.LEFT, padx=5)
+
+    def export_report(self, log, mode):
+        """Save the operation log, timings included, as a JSON report"""
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
+                                            initialfile="file_organizer_report.json")
+        if not path:
+            return
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(dict(log, mode=mode), f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the report:\n{str(e)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,280 @@
+"""
+Benchmark for the File Organizer engine (organizer_engine) without the GUI.
+
+Builds a synthetic source tree in a temp folder (tmpfs when available),
+then times the scan, match and transfer phases separately and prints the
+results as JSON, so runs can be saved and compared over time.
+
+Example:
+    python benchmark_organizer.py --files 100000 --depth 3 --mode move --output run.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import organizer_engine as organizer
+
+
+# Words file names are built from; the first ones are the rule keywords
+KEYWORDS = ['invoice', 'receipt', 'photo', '2024', 'report', 'draft', 'img', 'scan', 'backup', 'notes']
+EXTENSIONS = ['.pdf', '.jpg', '.txt', '.docx', '.png', '.csv']
+
+DEFAULT_RULES = [
+    ('invoice | receipt', 'Finance'),
+    ('photo * 2024', 'Photos'),
+    ('report ! draft', 'Reports'),
+    ('img', 'Images'),
+    ('scan', 'Scans'),
+]
+
+
+class TreeGenerator:
+    """
+    Writes a reproducible source tree: the same arguments and seed always
+    give the same names, folders and sizes.
+    """
+
+    def __init__(self, files, depth, fanout, name_dist, size_dist, mean_size, collision_rate, seed):
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.name_dist = name_dist
+        self.size_dist = size_dist
+        self.mean_size = mean_size
+        self.collision_rate = collision_rate
+        self.random = random.Random(seed)
+        # Zipf-like weights: the first keywords are much more common
+        self.weights = [1 / (rank + 1) for rank in range(len(KEYWORDS))]
+
+    def folders(self, root):
+        """All folders of a tree fanout wide and depth deep, root included"""
+        level = [root]
+        folders = [root]
+        for _ in range(self.depth):
+            level = [os.path.join(parent, f"dir{i:03d}") for parent in level for i in range(self.fanout)]
+            folders.extend(level)
+        return folders
+
+    def name(self, number):
+        if self.name_dist == 'zipf':
+            words = self.random.choices(KEYWORDS, weights=self.weights, k=2)
+        else:
+            words = self.random.sample(KEYWORDS, 2)
+        return f"{words[0]}_{words[1]}_{number:07d}{self.random.choice(EXTENSIONS)}"
+
+    def size(self):
+        if self.size_dist == 'fixed':
+            return self.mean_size
+        if self.size_dist == 'uniform':
+            return self.random.randint(0, 2 * self.mean_size)
+        # Log-normal with the requested mean: many small files, a few big ones
+        sigma = 1.0
+        return int(self.random.lognormvariate(math.log(max(self.mean_size, 1)) - sigma ** 2 / 2, sigma))
+
+    def build(self, root):
+        """Create the tree under root; returns (files, bytes) written"""
+        folders = self.folders(root)
+        for folder in folders:
+            os.makedirs(folder, exist_ok=True)
+
+        payload = os.urandom(1024 * 1024)
+        used_names = []
+        total_bytes = 0
+        for number in range(self.files):
+            if used_names and self.random.random() < self.collision_rate:
+                # Same name as an earlier file, so it collides in the target
+                name = self.random.choice(used_names)
+            else:
+                name = self.name(number)
+                used_names.append(name)
+            folder = self.random.choice(folders)
+            size = self.size()
+
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                path = os.path.join(folder, f"{number:07d}_{name}")
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                remaining = size
+                while remaining > 0:
+                    remaining -= os.write(fd, payload[:min(remaining, len(payload))])
+            finally:
+                os.close(fd)
+            total_bytes += size
+        return self.files, total_bytes
+
+
+def read_rss():
+    """Current resident set size in bytes, or None if unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PhaseTimer:
+    """
+    Context manager measuring one phase: wall and CPU time, syscalls and
+    bytes from /proc/self/io, and peak RSS sampled every 10 ms.
+    """
+    SAMPLE_SECONDS = 0.01
+
+    def __init__(self, name, results):
+        self.name = name
+        self.results = results
+        self.files = 0
+        self.bytes = 0
+        self.peak_rss = None
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        while not self.stopped.wait(self.SAMPLE_SECONDS):
+            rss = read_rss()
+            if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+                self.peak_rss = rss
+
+    def __enter__(self):
+        self.peak_rss = read_rss()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+        self.io_before = organizer.read_proc_io()
+        self.cpu_before = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu_before
+        io_after = organizer.read_proc_io()
+        self.stopped.set()
+        self.sampler.join()
+
+        result = {
+            'wall_seconds': round(wall, 4),
+            'cpu_seconds': round(cpu, 4),
+            'files': self.files,
+            'bytes': self.bytes,
+            'files_per_second': round(self.files / wall, 1) if wall > 0 else None,
+            'bytes_per_second': round(self.bytes / wall, 1) if wall > 0 else None,
+            'peak_rss_bytes': self.peak_rss,
+        }
+        if self.io_before and io_after:
+            syscalls = (io_after['syscr'] - self.io_before['syscr']) + (io_after['syscw'] - self.io_before['syscw'])
+            result['io_syscalls'] = syscalls
+            result['io_syscalls_per_second'] = round(syscalls / wall, 1) if wall > 0 else None
+            result['read_bytes'] = io_after['rchar'] - self.io_before['rchar']
+            result['write_bytes'] = io_after['wchar'] - self.io_before['wchar']
+        self.results[self.name] = result
+        return False
+
+
+def default_workdir():
+    """tmpfs where there is one, so the disk does not dominate the numbers"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scan, match and transfer phases headlessly")
+    parser.add_argument('--files', type=int, default=10000, help="number of files to generate")
+    parser.add_argument('--depth', type=int, default=2, help="folder levels below the source")
+    parser.add_argument('--fanout', type=int, default=8, help="subfolders per folder")
+    parser.add_argument('--name-dist', choices=['uniform', 'zipf'], default='zipf')
+    parser.add_argument('--size-dist', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    parser.add_argument('--mean-size', type=int, default=4096, help="mean file size in bytes")
+    parser.add_argument('--collision-rate', type=float, default=0.05,
+                        help="fraction of files reusing an earlier file's name")
+    parser.add_argument('--extra-rules', type=int, default=0,
+                        help="additional rules that never match, to load the matcher")
+    parser.add_argument('--mode', choices=['copy', 'move'], default='copy')
+    parser.add_argument('--workers', type=int, default=organizer.DEFAULT_WORKERS)
+    parser.add_argument('--scan-threads', type=int, default=organizer.DEFAULT_SCAN_THREADS,
+                        help="folders listed at once")
+    parser.add_argument('--ordered', action='store_true', help="keep the single-threaded walk order")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', default=default_workdir(), help="where the temp trees are made")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--keep', action='store_true', help="leave the generated trees in place")
+    args = parser.parse_args(argv)
+
+    pairs = DEFAULT_RULES + [(f"unused{i} * nomatch{i}", f"Unused{i}") for i in range(args.extra_rules)]
+    generator = TreeGenerator(args.files, args.depth, args.fanout, args.name_dist, args.size_dist,
+                              args.mean_size, args.collision_rate, args.seed)
+
+    root = tempfile.mkdtemp(prefix='organizer_bench_', dir=args.workdir)
+    source = os.path.join(root, 'source')
+    target = os.path.join(root, 'target')
+    os.makedirs(target)
+    phases = {}
+    try:
+        os.makedirs(source)
+        try:
+            config = organizer.make_config(source, target, pairs, mode=args.mode, workers=args.workers,
+                                           scan_threads=args.scan_threads)
+        except ValueError as e:
+            parser.error(str(e))
+
+        with PhaseTimer('generate', phases) as phase:
+            phase.files, phase.bytes = generator.build(source)
+
+        with PhaseTimer('scan', phases) as phase:
+            entries = []
+            for entry in organizer.iter_source_files(source, True, threads=args.scan_threads,
+                                                     ordered=args.ordered):
+                entries.append((entry.path, entry.name, entry.stat().st_size))
+            phase.files = len(entries)
+            phase.bytes = sum(size for _, _, size in entries)
+
+        # Matches go into a plan, as a preview would, so the transfer phase
+        # below runs exactly what Execute runs
+        with PhaseTimer('match', phases) as phase:
+            plan = organizer.ScanPlan(config)
+            for path, name, size in entries:
+                rule = config['rules'].match(name)
+                if rule is None:
+                    plan.add_unmatched()
+                else:
+                    plan.add(path, name, rule.folder_name, size)
+            plan.complete = True
+            phase.files = len(entries)
+
+        with PhaseTimer(args.mode, phases) as phase:
+            outcome = organizer.run_operation(config, organizer.ProgressCounter(), lambda: False, plan=plan)
+            phase.files = outcome.log['total_processed']
+            phase.bytes = outcome.log['stats']['counters'].get('bytes_transferred', 0)
+        phases[args.mode]['errors'] = len(outcome.log['errors'])
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'workdir': args.workdir or tempfile.gettempdir(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+        'rules': len(pairs),
+        'matched': len(plan),
+        'phases': phases,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3239 @@
+"""
+Engine of the File Organizer: keyword rules, scanning, matching and the
+copy/move pipeline, with no GUI dependencies. SortBasedonKeywords3 is the
+Tk front end; run this module directly to sort a folder from the command
+line, e.g. from cron:
+
+    python organizer_engine.py ~/Downloads --rules rules.csv --mode move
+"""
+import argparse
+import csv
+import errno
+import fnmatch
+import hashlib
+import heapq
+import io
+import json
+import operator
+import os
+import queue
+import re
+import select
+import shutil
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+
+DEFAULT_WORKERS = 4
+MAX_WORKERS = 32
+# copy and move transfer data; hardlink and symlink only add names for it
+MODES = ('copy', 'move', 'hardlink', 'symlink')
+# Folders listed at once when searching subfolders
+DEFAULT_SCAN_THREADS = 4
+# Entries a folder listed ahead hands over at a time, and chunks it may
+# have waiting, so a huge folder is neither read whole nor held in memory
+LISTING_CHUNK = 256
+LISTING_QUEUE_CHUNKS = 4
+JOURNAL_NAME = '.file_organizer_journal.jsonl'
+INDEX_NAME = '.file_organizer_index.sqlite'
+# Files this tool keeps in the source and target folders; never sorted themselves
+INTERNAL_FILES = {JOURNAL_NAME, INDEX_NAME, INDEX_NAME + '-journal'}
+
+# A file on its way through the pipeline. dest_name and op_id are only
+# known up front when resuming a journaled run.
+MatchedFile = namedtuple('MatchedFile', ['path', 'name', 'folder', 'size', 'dest_name', 'op_id'],
+                         defaults=[None, None])
+
+
+class KeywordSyntaxError(ValueError):
+    """Raised when a keyword expression cannot be parsed"""
+
+
+class TermMatcher:
+    """Matches when the term occurs in the filename"""
+
+    def __init__(self, text):
+        self.text = text
+
+    def evaluate(self, found, facts=None):
+        # An empty term is a substring of every name
+        return not self.text or self.text in found
+
+    def terms(self):
+        if self.text:
+            yield self.text
+
+    def required_terms(self):
+        return {self.text} if self.text else None
+
+    def fields(self):
+        return set()
+
+
+class AndMatcher:
+    """Matches when every child matches"""
+
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, found, facts=None):
+        return all(child.evaluate(found, facts) for child in self.children)
+
+    def terms(self):
+        for child in self.children:
+            yield from child.terms()
+
+    def fields(self):
+        return set().union(*(child.fields() for child in self.children))
+
+    def required_terms(self):
+        # Any single child's requirement is enough; keep the narrowest one
+        best = None
+        for child in self.children:
+            required = child.required_terms()
+            if required is not None and (best is None or len(required) < len(best)):
+                best = required
+        return best
+
+
+class OrMatcher:
+    """Matches when any child matches"""
+
+    def __init__(self, children):
+        self.children = children
+
+    def evaluate(self, found, facts=None):
+        return any(child.evaluate(found, facts) for child in self.children)
+
+    def terms(self):
+        for child in self.children:
+            yield from child.terms()
+
+    def fields(self):
+        return set().union(*(child.fields() for child in self.children))
+
+    def required_terms(self):
+        required = set()
+        for child in self.children:
+            child_required = child.required_terms()
+            if child_required is None:
+                return None
+            required |= child_required
+        return required
+
+
+class NotMatcher:
+    """Matches when the child does not match"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def evaluate(self, found, facts=None):
+        return not self.child.evaluate(found, facts)
+
+    def terms(self):
+        return self.child.terms()
+
+    def required_terms(self):
+        # Can be true with none of its terms present
+        return None
+
+    def fields(self):
+        return self.child.fields()
+
+
+def extension_key(name_lower):
+    """Key that stands in found-sets for a file's extension, e.g. ('ext', 'jpg')"""
+    return ('ext', os.path.splitext(name_lower)[1][1:])
+
+
+class ExtMatcher:
+    """ext:jpg or ext:jpg,png - matches on the file extension"""
+
+    def __init__(self, extensions):
+        self.keys = frozenset(('ext', extension.lstrip('.')) for extension in extensions)
+
+    def evaluate(self, found, facts=None):
+        return not self.keys.isdisjoint(found)
+
+    def terms(self):
+        return iter(())
+
+    def required_terms(self):
+        # Looked up by extension, like a term found in the name
+        return set(self.keys)
+
+    def fields(self):
+        return {'ext'}
+
+
+class CompareMatcher:
+    """size>5mb, age<30d or mtime>=2024-01-01 - compares the file's stat data"""
+    OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq}
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.compare = self.OPERATORS[op]
+        self.value = value
+
+    def evaluate(self, found, facts=None):
+        if facts is None:
+            return False
+        try:
+            stat = facts.stat()
+        except OSError:
+            return False
+        if self.field == 'size':
+            actual = stat.st_size
+        elif self.field == 'age':
+            actual = time.time() - stat.st_mtime
+        else:
+            actual = stat.st_mtime
+        return self.test(actual)
+
+    def test(self, actual):
+        return self.compare(actual, self.value)
+
+    def terms(self):
+        return iter(())
+
+    def required_terms(self):
+        return None
+
+    def fields(self):
+        return {self.field}
+
+
+class DateMatcher(CompareMatcher):
+    """
+    mtime=2024-01-01 and the like, where the date stands for that whole
+    day: = is any time on it, <= up to its end and > from the next day
+    """
+
+    def __init__(self, op, start, end):
+        super().__init__('mtime', op, start)
+        self.op = op
+        self.start = start
+        self.end = end
+
+    def test(self, actual):
+        if self.op == '=':
+            return self.start <= actual < self.end
+        if self.op == '<':
+            return actual < self.start
+        if self.op == '<=':
+            return actual < self.end
+        if self.op == '>':
+            return actual >= self.end
+        return actual >= self.start
+
+
+class DirMatcher:
+    """dir:text - matches when the file's folder, relative to the source, contains text"""
+
+    def __init__(self, text):
+        self.text = text.replace('\\', '/')
+
+    def evaluate(self, found, facts=None):
+        return facts is not None and self.text in facts.folder()
+
+    def terms(self):
+        return iter(())
+
+    def required_terms(self):
+        return None
+
+    def fields(self):
+        return {'dir'}
+
+
+SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2,
+              'g': 1024 ** 3, 'gb': 1024 ** 3, 't': 1024 ** 4, 'tb': 1024 ** 4}
+AGE_UNITS = {'': 86400, 's': 1, 'min': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400,
+             'mo': 30 * 86400, 'y': 365 * 86400}
+NAMED_PREDICATE = re.compile(r'^(ext|dir):\s*(\S.*)$')
+COMPARE_PREDICATE = re.compile(r'^(size|age|mtime)\s*(<=|>=|<|>|=)\s*(\S+)$')
+NUMBER_WITH_UNIT = re.compile(r'^(\d+(?:\.\d+)?)\s*([a-z]*)$')
+
+
+def parse_predicate(text):
+    """Matcher for a metadata predicate such as ext:jpg or size>5mb; None for a plain term"""
+    named = NAMED_PREDICATE.match(text)
+    if named:
+        if named.group(1) == 'ext':
+            return ExtMatcher(extension.strip() for extension in named.group(2).split(',') if extension.strip())
+        return DirMatcher(named.group(2).strip())
+    
+    compare = COMPARE_PREDICATE.match(text)
+    if not compare:
+        return None
+    field, op, value = compare.groups()
+    if field == 'mtime':
+        try:
+            day = time.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise KeywordSyntaxError(f"Invalid date '{value}', use YYYY-MM-DD")
+        # Local midnight at the start of the day and of the next one
+        # (mktime normalises the day past the end of a month)
+        start = time.mktime(day)
+        end = time.mktime((day.tm_year, day.tm_mon, day.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+        return DateMatcher(op, start, end)
+    
+    units = SIZE_UNITS if field == 'size' else AGE_UNITS
+    number = NUMBER_WITH_UNIT.match(value)
+    if not number or number.group(2) not in units:
+        raise KeywordSyntaxError(f"Invalid {field} '{value}'")
+    return CompareMatcher(field, op, float(number.group(1)) * units[number.group(2)])
+
+
+class FileFacts:
+    """
+    What metadata predicates test about one file, taken from the DirEntry
+    the walk already has, so its stat() (cached by the DirEntry) is the
+    only one made for the file
+    """
+    __slots__ = ('entry', 'source')
+
+    def __init__(self, entry, source):
+        self.entry = entry
+        self.source = source
+
+    def stat(self):
+        return self.entry.stat()
+
+    def folder(self):
+        """Folder of the file relative to the source, lowercase and '/'-separated"""
+        folder = os.path.relpath(os.path.dirname(self.entry.path), self.source)
+        return '' if folder == '.' else folder.replace(os.sep, '/').lower()
+
+
+class PathEntry:
+    """Stands in for os.DirEntry where only a path (and maybe its stat) is known"""
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path, stat=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = stat
+
+    def stat(self, follow_symlinks=True):
+        if not follow_symlinks:
+            return os.lstat(self.path)
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+class KeywordParser:
+    """
+    Recursive descent parser for keyword expressions.
+
+    Precedence from loosest to tightest:
+        a | b      OR
+        a * b      AND
+        a ! b      a but NOT b (a leading "!b" is a plain NOT)
+        ( ... )    grouping, "..." quotes a literal term
+    An empty operand matches everything, which keeps "! draft" and
+    "a |" behaving as they always have. An unquoted term of the form
+    ext:jpg, dir:name, size>5mb, age<30d or mtime>=2024-01-01 is a
+    metadata predicate instead of text to find in the name; an mtime date
+    means that whole day, so mtime=2024-01-01 is any time on it.
+    """
+    OPERATORS = '*|!()'
+
+    def __init__(self, keyword):
+        self.tokens = self.tokenize(keyword.lower())
+        self.pos = 0
+
+    @classmethod
+    def tokenize(cls, text):
+        """Split an expression into operator characters and term strings"""
+        tokens = []
+        term = []
+        quoted = False
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == '"':
+                end = text.find('"', i + 1)
+                if end == -1:
+                    raise KeywordSyntaxError("Missing closing quote")
+                term.append(text[i + 1:end])
+                quoted = True
+                i = end + 1
+                continue
+            if char in cls.OPERATORS:
+                cls._flush_term(tokens, term, quoted)
+                term = []
+                quoted = False
+                tokens.append(('op', char))
+            else:
+                term.append(char)
+            i += 1
+        cls._flush_term(tokens, term, quoted)
+        return tokens
+
+    @staticmethod
+    def _flush_term(tokens, term, quoted):
+        """Append the pending term, ignoring bare whitespace between operators"""
+        text = ''.join(term).strip()
+        if text or quoted:
+            tokens.append(('term', text, quoted))
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def accept(self, op):
+        if self.peek() == ('op', op):
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        matcher = self.parse_or()
+        token = self.peek()
+        if token is not None:
+            raise KeywordSyntaxError(f"Unexpected '{token[1]}'")
+        return matcher
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.accept('|'):
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else OrMatcher(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.accept('*'):
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else AndMatcher(children)
+
+    def parse_not(self):
+        children = [self.parse_unary()]
+        while self.accept('!'):
+            children.append(NotMatcher(self.parse_unary()))
+        return children[0] if len(children) == 1 else AndMatcher(children)
+
+    def parse_unary(self):
+        if self.accept('!'):
+            return NotMatcher(self.parse_unary())
+        if self.accept('('):
+            matcher = self.parse_or()
+            if not self.accept(')'):
+                raise KeywordSyntaxError("Missing closing ')'")
+            return matcher
+        token = self.peek()
+        if token is not None and token[0] == 'term':
+            self.pos += 1
+            predicate = None if token[2] else parse_predicate(token[1])
+            return predicate if predicate is not None else TermMatcher(token[1])
+        # Empty operand, e.g. the left side of "! draft"
+        return TermMatcher('')
+
+
+@lru_cache(maxsize=1024)
+def compile_keyword(keyword):
+    """Compile a keyword expression into a matcher tree"""
+    return KeywordParser(keyword).parse()
+
+
+class KeywordRule:
+    """A compiled keyword expression and the folder its matches go to"""
+
+    def __init__(self, keyword, folder_name, index=0):
+        self.keyword = keyword
+        self.folder_name = folder_name
+        self.index = index
+        self.matcher = compile_keyword(keyword)
+        self.terms = frozenset(self.matcher.terms())
+
+    def matches(self, name_lower, facts=None):
+        found = {term for term in self.terms if term in name_lower}
+        found.add(extension_key(name_lower))
+        return self.matcher.evaluate(found, facts)
+
+
+def compile_rules(pairs):
+    """Compile (keyword, folder) pairs once per run, keeping their order"""
+    return [KeywordRule(keyword, folder_name, index)
+            for index, (keyword, folder_name) in enumerate(pairs)]
+
+
+def check_rules(pairs):
+    """
+    Every problem with a list of (keyword, folder) pairs in one pass, as
+    (index, message) tuples; empty when all of them would compile.
+    """
+    problems = []
+    for index, (keyword, folder_name) in enumerate(pairs):
+        if not keyword.strip():
+            problems.append((index, "keyword is empty"))
+        elif not folder_name.strip():
+            problems.append((index, "folder name is empty"))
+        else:
+            try:
+                compile_keyword(keyword)
+            except KeywordSyntaxError as e:
+                problems.append((index, str(e)))
+    return problems
+
+
+def describe_rule_problems(problems, limit=10):
+    """check_rules output as a message, numbering rules from 1"""
+    lines = [f"Rule {index + 1}: {message}" for index, message in problems[:limit]]
+    if len(problems) > limit:
+        lines.append(f"...and {len(problems) - limit} more")
+    return "\n".join(lines)
+
+
+class AhoCorasick:
+    """Finds which of a fixed set of strings occur in a text in one pass"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [frozenset()]
+        
+        # Build the trie
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(frozenset())
+                state = next_state
+            self.output[state] = self.output[state] | {pattern}
+        
+        # Breadth-first pass to link each state to its longest proper suffix
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] | self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """Return the set of patterns that occur in text"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class RuleIndex:
+    """
+    Matches a filename against all rules with a single scan.
+
+    Every literal term from every rule goes into one automaton. A rule is
+    only evaluated when one of the terms it cannot match without was found,
+    or when it can match on absent terms alone (e.g. "! draft"). The file
+    extension counts as a found key too, so ext: rules are picked by a
+    dict lookup. Candidates are tried in rule order so the first matching
+    rule still wins.
+
+    fields tells which metadata the rules read; callers only build
+    FileFacts when there is something besides the extension. hits counts
+    the matches of every rule, for reporting after a run.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        # Files matched by each rule, in rule order
+        self.hits = [0] * len(rules)
+        self.rules_by_term = {}
+        self.always_checked = []
+        self.fields = set().union(*(rule.matcher.fields() for rule in rules))
+        self.needs_facts = bool(self.fields - {'ext'})
+        
+        for rule in rules:
+            required = rule.matcher.required_terms()
+            if required is None:
+                self.always_checked.append(rule.index)
+            else:
+                for term in required:
+                    self.rules_by_term.setdefault(term, []).append(rule.index)
+        
+        self.automaton = AhoCorasick(set().union(*(rule.terms for rule in rules)))
+
+    def match(self, filename, facts=None):
+        """Return the first rule matching filename (and its FileFacts, if given), or None"""
+        name_lower = filename.lower()
+        found = self.automaton.find(name_lower)
+        found.add(extension_key(name_lower))
+        
+        candidates = set(self.always_checked)
+        for term in found:
+            candidates.update(self.rules_by_term.get(term, ()))
+        
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if rule.matcher.evaluate(found, facts):
+                self.hits[index] += 1
+                return rule
+        return None
+
+
+# Folders that hold operating system data rather than user files
+SYSTEM_FOLDERS = {'$recycle.bin', 'system volume information', 'lost+found', '__macosx', '.trash', '.trashes'}
+
+
+class FolderFilter:
+    """
+    Decides which subfolders the walk never enters: the target folder
+    when it lies inside the source, the destination folders of the rules
+    (already sorted files), hidden and system folders if skip_hidden is
+    set, and folders whose name or path below the source matches one of
+    the exclude glob patterns.
+    """
+
+    def __init__(self, source, target, folder_names, skip_hidden=False, exclude=()):
+        self.source = os.path.abspath(source)
+        self.skip_hidden = skip_hidden
+        self.exclude = [pattern.lower() for pattern in exclude]
+        target = os.path.normcase(os.path.abspath(target))
+        self.destinations = {os.path.normcase(os.path.join(target, name)) for name in folder_names}
+        if target != os.path.normcase(self.source):
+            self.destinations.add(target)
+
+    @staticmethod
+    def parse_patterns(text):
+        """Exclude patterns from a comma or semicolon separated string"""
+        return [pattern.strip() for pattern in re.split(r'[;,]', text) if pattern.strip()]
+
+    def excluded(self, entry):
+        """True if the folder entry (a DirEntry or PathEntry) should not be walked"""
+        name = entry.name.lower()
+        if self.skip_hidden:
+            if name.startswith('.') or name in SYSTEM_FOLDERS:
+                return True
+            if os.name == 'nt':
+                # Hidden (2) or system (4) attribute; free from the DirEntry on Windows
+                try:
+                    if entry.stat(follow_symlinks=False).st_file_attributes & 0x6:
+                        return True
+                except (OSError, AttributeError):
+                    pass
+        
+        path = os.path.abspath(entry.path)
+        if os.path.normcase(path) in self.destinations:
+            return True
+        if self.exclude:
+            relative = os.path.relpath(path, self.source).replace(os.sep, '/').lower()
+            for pattern in self.exclude:
+                if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative, pattern):
+                    return True
+        return False
+
+
+def scan_folder(directory, include_subfolders, subfolders, onerror=None, index=None, stats=None, prune=None):
+    """
+    Yield a DirEntry for every file in one folder, appending the paths of
+    its subfolders, minus those a FolderFilter prune excludes, to
+    subfolders. Raises OSError if the folder cannot be listed; failures
+    on single entries go to onerror (if given).
+
+    With an IncrementalIndex, files whose size and mtime match an earlier
+    decision are not yielded. A folder whose mtime is unchanged since a
+    completed earlier run is not listed at all (its recorded subfolders
+    are still returned); as editing a file in place leaves the folder
+    mtime alone, its recorded files are stat'ed one by one instead.
+    """
+    known = {}
+    if index is not None:
+        mtime_ns = os.stat(directory).st_mtime_ns
+        subfolder_names = index.unchanged_subfolders(directory, mtime_ns)
+        if subfolder_names is not None:
+            subfolders.extend(os.path.join(directory, name) for name in subfolder_names)
+            skipped = 0
+            for name, recorded in index.known_files(directory).items():
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    if onerror is not None:
+                        onerror(e)
+                    continue
+                if recorded == (stat.st_size, stat.st_mtime_ns):
+                    skipped += 1
+                else:
+                    yield PathEntry(path, stat)
+            index.add_skipped(skipped)
+            return
+        known = index.known_files(directory)
+    entries = os.scandir(directory)
+    if stats is not None:
+        stats.count('folders_listed')
+    
+    first_subfolder = len(subfolders)
+    file_names = []
+    skipped = 0
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    if entry.name in INTERNAL_FILES:
+                        continue
+                    file_names.append(entry.name)
+                    if known and entry.name in known:
+                        stat = entry.stat()
+                        if known[entry.name] == (stat.st_size, stat.st_mtime_ns):
+                            skipped += 1
+                            continue
+                    yield entry
+                elif include_subfolders and entry.is_dir(follow_symlinks=False):
+                    if prune is not None and prune.excluded(entry):
+                        if stats is not None:
+                            stats.count('folders_pruned')
+                        continue
+                    subfolders.append(entry.path)
+            except OSError as e:
+                if onerror is not None:
+                    onerror(e)
+    
+    if index is not None:
+        index.add_skipped(skipped)
+        index.listed(directory, mtime_ns, [os.path.basename(path) for path in subfolders[first_subfolder:]],
+                     file_names)
+
+
+def iter_source_files(source, include_subfolders, onerror=None, index=None, stats=None,
+                      threads=1, ordered=False, prune=None):
+    """
+    Yield a DirEntry for every file under source as it is discovered.
+
+    Subfolders are listed depth-first with os.scandir so the first match
+    is available immediately. Failure to list the source itself raises;
+    failures below it go to onerror (if given) and the walk continues,
+    like os.walk.
+
+    With threads > 1 several folders are listed at once, which pays off
+    where each listing waits on the network (NFS, SMB). Files then come
+    out as folders finish, unless ordered is set, which keeps the order
+    of the single-threaded walk and only lists ahead of it.
+
+    index, stats and prune are handed on to scan_folder.
+    """
+    if threads > 1 and include_subfolders:
+        yield from _walk_parallel(source, onerror, index, stats, threads, ordered, prune)
+        return
+    
+    pending = [source]
+    while pending:
+        directory = pending.pop()
+        subfolders = []
+        try:
+            yield from scan_folder(directory, include_subfolders, subfolders, onerror, index, stats, prune)
+        except OSError as e:
+            if directory == source:
+                raise
+            if onerror is not None:
+                onerror(e)
+            continue
+        
+        # Reverse so subfolders are visited in listing order
+        pending.extend(reversed(subfolders))
+
+
+def _walk_parallel(source, onerror, index, stats, threads, ordered, prune):
+    """
+    iter_source_files with include_subfolders, listing up to 2 * threads
+    folders ahead. Each listing streams its entries in LISTING_CHUNK
+    chunks through a bounded queue, so the first file of a huge folder
+    comes out at once and memory stays flat.
+    """
+    stopped = threading.Event()
+
+    def put(channel, message):
+        """Queue message, or give up once the walk is abandoned; False then"""
+        while not stopped.is_set():
+            try:
+                channel.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def list_folder(directory, channel):
+        """
+        Send ('files', directory, entries) chunks for one folder, then
+        ('done', directory, subfolders) or ('error', directory, exception)
+        """
+        subfolders = []
+        chunk = []
+        entries = scan_folder(directory, True, subfolders, onerror, index, stats, prune)
+        try:
+            for entry in entries:
+                chunk.append(entry)
+                if len(chunk) >= LISTING_CHUNK:
+                    if not put(channel, ('files', directory, chunk)):
+                        return
+                    chunk = []
+        except Exception as e:
+            put(channel, ('error', directory, e))
+            return
+        finally:
+            entries.close()
+        if chunk and not put(channel, ('files', directory, chunk)):
+            return
+        put(channel, ('done', directory, subfolders))
+
+    def failed(directory, error):
+        """Report a folder that could not be listed; only the source itself is fatal"""
+        if directory == source or not isinstance(error, OSError):
+            raise error
+        if onerror is not None:
+            onerror(error)
+
+    window = threads * 2
+    executor = ThreadPoolExecutor(max_workers=threads)
+    try:
+        if ordered:
+            # Stack of [path, future, queue]; the top is the next folder in
+            # walk order, and the next few below it are listed in advance
+            pending = [[source, None, None]]
+            while pending:
+                for node in pending[-window:]:
+                    if node[1] is None:
+                        node[2] = queue.Queue(maxsize=LISTING_QUEUE_CHUNKS)
+                        node[1] = executor.submit(list_folder, node[0], node[2])
+                directory, future, channel = pending.pop()
+                subfolders = []
+                if future.cancel():
+                    # Its turn came before a thread was free: list it here
+                    # rather than wait behind folders further ahead
+                    try:
+                        yield from scan_folder(directory, True, subfolders, onerror, index, stats, prune)
+                    except OSError as e:
+                        failed(directory, e)
+                        continue
+                else:
+                    while True:
+                        kind, _, payload = channel.get()
+                        if kind != 'files':
+                            break
+                        yield from payload
+                    if kind == 'error':
+                        failed(directory, payload)
+                        continue
+                    subfolders = payload
+                pending.extend([path, None, None] for path in reversed(subfolders))
+        else:
+            # All listings share one queue; files come out as they arrive
+            channel = queue.Queue(maxsize=window * LISTING_QUEUE_CHUNKS)
+            executor.submit(list_folder, source, channel)
+            running = 1
+            pending = []
+            while running:
+                kind, directory, payload = channel.get()
+                if kind == 'files':
+                    yield from payload
+                    continue
+                running -= 1
+                if kind == 'error':
+                    failed(directory, payload)
+                else:
+                    pending.extend(reversed(payload))
+                while pending and running < window:
+                    executor.submit(list_folder, pending.pop(), channel)
+                    running += 1
+    finally:
+        # Stopped early (cancel) or done: do not wait for folders listed ahead
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_matches(config, onerror=None, index=None, stats=None):
+    """Yield a MatchedFile for every file matching a rule, timing both stages in stats if given"""
+    rules = config['rules']
+    entries = iter_source_files(config['source'], config['include_subfolders'], onerror, index, stats,
+                                threads=config['scan_threads'], prune=config['prune'])
+    if stats is not None:
+        entries = stats.timed_iter(entries, 'scan')
+    for entry in entries:
+        facts = FileFacts(entry, config['source']) if rules.needs_facts else None
+        if stats is not None:
+            start = time.perf_counter()
+            rule = rules.match(entry.name, facts)
+            stats.add('match', time.perf_counter() - start)
+        else:
+            rule = rules.match(entry.name, facts)
+        if rule is None:
+            if index is not None:
+                index.record_unmatched(entry)
+            continue
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            size = 0
+        yield MatchedFile(entry.path, entry.name, rule.folder_name, size)
+
+
+class IncrementalIndex:
+    """
+    SQLite record, kept in the source folder, of what earlier runs decided
+    about each source file (size, mtime, "unmatched" or "done") and of the
+    mtime and subfolders of every folder they listed completely.
+
+    Everything is tied to a fingerprint of the rules and settings; when
+    those change the index starts over. Folder records are only written
+    when a run finishes its walk, and never for a folder that had a
+    failed or skipped file, so a later run cannot skip work that was not
+    actually done.
+    """
+    COMMIT_EVERY = 1000
+
+    def __init__(self, config):
+        self.path = os.path.join(config['source'], INDEX_NAME)
+        self.lock = threading.Lock()
+        self.listed_folders = {}
+        self.dirty_folders = set()
+        self.pending = []
+        self.stale = []
+        self.skipped = 0
+        
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, mtime_ns INTEGER, subfolders TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (folder TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, "
+                        "decision TEXT, PRIMARY KEY (folder, name)) WITHOUT ROWID")
+        
+        # With age rules a file's decision changes as time passes, so only
+        # files transferred before are trusted, and every folder is listed
+        self.time_dependent = 'age' in config['rules'].fields
+        
+        fingerprint = self.fingerprint(config)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            # Different rules or settings: earlier decisions no longer apply
+            self.db.execute("DELETE FROM folders")
+            self.db.execute("DELETE FROM files")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self.db.commit()
+
+    @staticmethod
+    def fingerprint(config):
+        settings = [config['pairs'], config['mode'], os.path.abspath(config['target']),
+                    config['include_subfolders'], config['skip_hidden'], config['exclude']]
+        return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()
+
+    def unchanged_subfolders(self, folder, mtime_ns):
+        """Subfolder names if folder is unchanged since it was last listed, else None"""
+        if self.time_dependent:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT mtime_ns, subfolders FROM folders WHERE path = ?", (folder,)).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        return json.loads(row[1])
+
+    def known_files(self, folder):
+        """{name: (size, mtime_ns)} of files in folder with a recorded decision"""
+        with self.lock:
+            rows = self.db.execute("SELECT name, size, mtime_ns FROM files WHERE folder = ?", (folder,)).fetchall()
+        return {name: (size, mtime_ns) for name, size, mtime_ns in rows}
+
+    def add_skipped(self, count):
+        with self.lock:
+            self.skipped += count
+
+    def listed(self, folder, mtime_ns, subfolder_names, file_names):
+        """Remember a completed listing; written to the index by commit()"""
+        with self.lock:
+            self.listed_folders[folder] = (mtime_ns, subfolder_names, file_names)
+
+    def record(self, path, stat, decision):
+        if self.time_dependent and decision == 'unmatched':
+            return
+        folder, name = os.path.split(path)
+        with self.lock:
+            self.pending.append((folder, name, stat.st_size, stat.st_mtime_ns, decision))
+            if len(self.pending) >= self.COMMIT_EVERY:
+                self._write_pending()
+
+    def record_unmatched(self, entry):
+        """Remember that no rule matched a file, unless it can no longer be stat'ed"""
+        try:
+            self.record(entry.path, entry.stat(), 'unmatched')
+        except OSError:
+            self.mark_dirty(entry.path)
+
+    def record_done(self, path):
+        """Remember that a file was transferred; only useful while it stays in the source"""
+        try:
+            self.record(path, os.stat(path), 'done')
+        except OSError:
+            self.mark_dirty(path)
+
+    def mark_dirty(self, path):
+        """A file in this folder still needs work, so the folder must be listed again"""
+        with self.lock:
+            self.dirty_folders.add(os.path.dirname(path))
+
+    def _write_pending(self):
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", self.pending)
+        self.db.commit()
+        self.pending = []
+
+    def commit(self, walk_complete):
+        """Write pending decisions, and folder records if the walk completed"""
+        with self.lock:
+            self._write_pending()
+            for folder in self.dirty_folders:
+                self.db.execute("DELETE FROM folders WHERE path = ?", (folder,))
+            if walk_complete:
+                for folder, (mtime_ns, subfolder_names, file_names) in self.listed_folders.items():
+                    # Forget files that are gone, e.g. moved away by this run
+                    present = set(file_names)
+                    for (name,) in self.db.execute("SELECT name FROM files WHERE folder = ?", (folder,)).fetchall():
+                        if name not in present:
+                            self.db.execute("DELETE FROM files WHERE folder = ? AND name = ?", (folder, name))
+                    if folder not in self.dirty_folders:
+                        self.db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)",
+                                        (folder, mtime_ns, json.dumps(subfolder_names)))
+            self.db.commit()
+            self.listed_folders = {}
+
+    def close(self):
+        self.db.close()
+
+
+class ScanPlan:
+    """
+    Result of a preview scan: every matched file with its destination
+    folder, plus per-folder counts and sample names for display. Built in
+    the background, and read by the UI while it grows. A complete plan can
+    be handed to Execute, which then only checks that each file still
+    exists instead of walking the source again.
+
+    Matched files are stored column-wise to stay small for millions of
+    files: source folders and destination folders are interned and
+    referenced by id from arrays, sizes sit in an array, and names are
+    packed into one byte buffer. Unmatched files are only counted, and
+    only SAMPLE_SIZE names per destination are kept for display.
+    """
+    SAMPLE_SIZE = 10
+
+    def __init__(self, config):
+        self.key = self.config_key(config)
+        self.rules = config['rules']
+        self.lock = threading.Lock()
+        self.directories = []
+        self.directory_ids = {}
+        self.destinations = []
+        self.destination_ids = {}
+        self.item_directories = array('I')
+        self.item_destinations = array('I')
+        self.item_sizes = array('q')
+        self.names = bytearray()
+        self.name_ends = array('Q')
+        self.folder_counts = {}
+        self.samples = {}
+        self.unmatched = 0
+        self.scan_errors = []
+        self.index = None
+        self.seconds = 0.0
+        self.complete = False
+        self.error = None
+
+    @staticmethod
+    def config_key(config):
+        """The inputs that decide which files match and where they go"""
+        return (config['source'], config['target'], tuple(config['pairs']), config['include_subfolders'],
+                config['skip_hidden'], tuple(config['exclude']),
+                config['incremental'], config['mode'] if config['incremental'] else None)
+
+    def matches_config(self, config):
+        return self.complete and self.error is None and self.key == self.config_key(config)
+
+    def __len__(self):
+        return len(self.item_sizes)
+
+    @staticmethod
+    def _intern(values, ids, value):
+        """Id of value in values, adding it the first time"""
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def add(self, file_path, filename, folder_name, size):
+        with self.lock:
+            self.item_directories.append(
+                self._intern(self.directories, self.directory_ids, os.path.dirname(file_path)))
+            self.item_destinations.append(
+                self._intern(self.destinations, self.destination_ids, folder_name))
+            self.item_sizes.append(size)
+            self.names += os.fsencode(filename)
+            self.name_ends.append(len(self.names))
+            if folder_name not in self.folder_counts:
+                self.folder_counts[folder_name] = 0
+                self.samples[folder_name] = []
+            self.folder_counts[folder_name] += 1
+            if len(self.samples[folder_name]) < self.SAMPLE_SIZE:
+                self.samples[folder_name].append(filename)
+
+    def add_unmatched(self):
+        with self.lock:
+            self.unmatched += 1
+
+    def snapshot(self):
+        """(folder_counts, samples, unmatched) copied for display"""
+        with self.lock:
+            return (dict(self.folder_counts),
+                    {folder: list(names) for folder, names in self.samples.items()},
+                    self.unmatched)
+
+    def build(self, config, is_cancelled):
+        """
+        Scan and match the source into this plan; meant for a background
+        thread. In incremental mode the plan keeps the open index, which
+        Execute later commits.
+        """
+        rules = config['rules']
+        start = time.perf_counter()
+        try:
+            if config['incremental']:
+                self.index = IncrementalIndex(config)
+            # In walk order, so the same tree always gives the same preview
+            for entry in iter_source_files(config['source'], config['include_subfolders'],
+                                           onerror=lambda e: self.scan_errors.append(str(e)), index=self.index,
+                                           threads=config['scan_threads'], ordered=True,
+                                           prune=config['prune']):
+                if is_cancelled():
+                    self.discard()
+                    return
+                facts = FileFacts(entry, config['source']) if rules.needs_facts else None
+                rule = rules.match(entry.name, facts)
+                if rule is None:
+                    if self.index is not None:
+                        self.index.record_unmatched(entry)
+                    self.add_unmatched()
+                    continue
+                try:
+                    size = entry.stat().st_size
+                except OSError:
+                    size = 0
+                self.add(entry.path, entry.name, rule.folder_name, size)
+        except Exception as e:
+            self.error = e
+            self.discard()
+        self.seconds = time.perf_counter() - start
+        self.complete = True
+
+    def discard(self):
+        """Release the incremental index of a plan that will not be executed"""
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    def iter_items(self):
+        """Yield (path, filename, folder_name, size) for every matched file, in scan order"""
+        start = 0
+        for i in range(len(self.item_sizes)):
+            end = self.name_ends[i]
+            filename = os.fsdecode(bytes(self.names[start:end]))
+            start = end
+            yield (os.path.join(self.directories[self.item_directories[i]], filename), filename,
+                   self.destinations[self.item_destinations[i]], self.item_sizes[i])
+
+    def iter_existing(self, onmissing):
+        """Yield planned items whose file still exists, refreshing its size"""
+        for file_path, filename, folder_name, size in self.iter_items():
+            try:
+                size = os.stat(file_path).st_size
+            except OSError as e:
+                onmissing(file_path, e)
+                continue
+            yield MatchedFile(file_path, filename, folder_name, size)
+
+
+def same_file_data(src, dst):
+    """True if dst looks like a finished copy of src (size and mtime match)"""
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if os.path.samestat(src_stat, dst_stat):
+        return True
+    # copystat sets the mtime last; allow for coarse (FAT) timestamps
+    return (src_stat.st_size == dst_stat.st_size
+            and abs(src_stat.st_mtime - dst_stat.st_mtime) <= 2)
+
+
+class RunJournal:
+    """
+    Append-only JSON Lines record of a run, kept in the target folder.
+
+    The first line describes the run (mode, folders, rules). Each transfer
+    is written as a "plan" record before it is handed to a worker and a
+    "done" record after it succeeds; a "scanned" record marks the end of
+    the source walk. A transfer that has to switch to another name is
+    planned again under the same id, and the last plan counts. Records
+    are buffered and fsynced in batches. Plans are pushed to the OS
+    before their transfer starts, so a crashed process never leaves a
+    transferred file the journal doesn't know of.
+    """
+    FSYNC_EVERY = 512
+    FSYNC_INTERVAL = 1.0
+
+    def __init__(self, target, header=None):
+        """Start a new journal with header, or append to the existing one"""
+        self.path = self.path_for(target)
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.next_id = 0
+        if header is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        else:
+            os.makedirs(target, exist_ok=True)
+            self.file = open(self.path, 'w', encoding='utf-8')
+            self._append(dict(header, type='run'))
+            self.flush(sync=True)
+
+    @staticmethod
+    def path_for(target):
+        return os.path.join(target, JOURNAL_NAME)
+
+    @classmethod
+    def exists(cls, target):
+        return os.path.isfile(cls.path_for(target))
+
+    @classmethod
+    def load(cls, target):
+        """Read the journal in target into a JournalState; None if there is none"""
+        try:
+            with open(cls.path_for(target), encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        
+        state = JournalState()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            kind = record.get('type')
+            if kind == 'run':
+                state.header = record
+            elif kind == 'plan':
+                state.plans[record['id']] = record
+            elif kind == 'done':
+                state.done.add(record['id'])
+            elif kind == 'scanned':
+                state.scanned = True
+        return state if state.header is not None else None
+
+    def _append(self, record):
+        self.buffer.append(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def record_plan(self, item, dest_name, op_id=None):
+        """
+        Journal a transfer before it starts and return its id; with op_id,
+        record a new destination name for a transfer planned before.
+        """
+        with self.lock:
+            if op_id is None:
+                op_id = self.next_id
+                self.next_id += 1
+            self._append({'type': 'plan', 'id': op_id, 'src': item.path,
+                          'folder': item.folder, 'dst': dest_name})
+        return op_id
+
+    def record_done(self, op_id):
+        with self.lock:
+            self._append({'type': 'done', 'id': op_id})
+            self.unsynced += 1
+            due = (self.unsynced >= self.FSYNC_EVERY
+                   or time.monotonic() - self.last_sync >= self.FSYNC_INTERVAL)
+        if due:
+            self.flush(sync=True)
+
+    def record_scanned(self):
+        with self.lock:
+            self._append({'type': 'scanned'})
+
+    def flush(self, sync=False):
+        """Write buffered records to the OS, and to disk if sync"""
+        with self.lock:
+            if self.buffer:
+                self.file.write(''.join(self.buffer))
+                self.buffer = []
+                self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+                self.unsynced = 0
+                self.last_sync = time.monotonic()
+
+    def close(self, remove=False):
+        """Flush and close; remove the file once the run needs no resume"""
+        self.flush(sync=True)
+        self.file.close()
+        if remove:
+            os.unlink(self.path)
+
+
+class JournalState:
+    """What a journal says about an interrupted run"""
+
+    def __init__(self):
+        self.header = None
+        self.plans = {}
+        self.done = set()
+        self.scanned = False
+
+    def pending(self):
+        return [plan for op_id, plan in sorted(self.plans.items()) if op_id not in self.done]
+
+    def config(self):
+        """Run settings from the header, in validate_inputs form"""
+        pairs = [tuple(pair) for pair in self.header['pairs']]
+        return {
+            'source': self.header['source'],
+            'target': self.header['target'],
+            'pairs': pairs,
+            'rules': RuleIndex(compile_rules(pairs)),
+            'mode': self.header['mode'],
+            'include_subfolders': self.header['include_subfolders'],
+            'skip_hidden': self.header.get('skip_hidden', False),
+            'exclude': self.header.get('exclude', []),
+            'prune': FolderFilter(self.header['source'], self.header['target'], [folder for _, folder in pairs],
+                                  self.header.get('skip_hidden', False), self.header.get('exclude', [])),
+            'scan_threads': DEFAULT_SCAN_THREADS,
+            'incremental': False,
+            'dedup': self.header.get('dedup', 'off'),
+        }
+
+    def iter_remaining(self, config, on_finished, onmissing, onerror):
+        """
+        Yield what is left of the run. Journaled transfers come first:
+        ones whose destination is already complete are reported through
+        on_finished, and temp files of unfinished copies are removed. The
+        rest are redone under their planned name, or, if something that
+        is not a copy of the source has that name now, under a fresh one
+        (dest_name None); a file that may not be ours is never removed.
+        If the walk itself was interrupted, the source is walked again for
+        files the journal has never seen.
+        """
+        for plan in self.pending():
+            src = plan['src']
+            dst = os.path.join(config['target'], plan['folder'], plan['dst'])
+            try:
+                # Left behind by a copy that was killed halfway
+                os.unlink(os.path.join(config['target'], plan['folder'], FileCopier.temp_name(plan['dst'])))
+            except FileNotFoundError:
+                pass
+            source_exists = os.path.lexists(src)
+            dest_name = plan['dst']
+            if os.path.lexists(dst):
+                if not source_exists or same_file_data(src, dst):
+                    if source_exists and config['mode'] == 'move':
+                        # Copied across devices, but the original was not deleted yet
+                        os.unlink(src)
+                    on_finished(plan)
+                    continue
+                # Someone else's file took the name
+                dest_name = None
+            if not source_exists:
+                onmissing(src, FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), src))
+                continue
+            yield MatchedFile(src, os.path.basename(src), plan['folder'], os.stat(src).st_size,
+                              dest_name, plan['id'])
+        
+        if not self.scanned:
+            journaled = {plan['src'] for plan in self.plans.values()}
+            for item in iter_matches(config, onerror):
+                if item.path not in journaled:
+                    yield item
+
+
+def format_bytes(size):
+    """Human readable byte count, e.g. 12.3 MB"""
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_duration(seconds):
+    """Compact duration, e.g. 1h 02m or 3m 20s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def read_proc_io():
+    """Read/write syscall and byte counters from /proc/self/io, or {} where there is none"""
+    try:
+        with open('/proc/self/io') as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+class RunStats:
+    """
+    Time spent and work done in each phase of a run (scan, match, mkdir,
+    collisions, journal, dedup, transfer), the slowest transfers, and the
+    process's read/write syscalls and bytes from /proc/self/io.
+
+    Transfer time is summed over all workers, so with several workers it
+    can exceed the wall time of the run.
+    """
+    SLOWEST = 10
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = {}
+        self.slowest = []
+        self.started = time.perf_counter()
+        self.io_started = read_proc_io()
+        self.wall_seconds = None
+        self.io = {}
+
+    def add(self, phase, seconds, count=1):
+        with self.lock:
+            totals = self.phases.setdefault(phase, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += count
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def timed_iter(self, iterable, phase):
+        """Yield from iterable, adding the time spent producing each item to phase"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(phase, time.perf_counter() - start, 0)
+                return
+            self.add(phase, time.perf_counter() - start)
+            yield item
+
+    def add_transfer(self, path, size, seconds):
+        with self.lock:
+            totals = self.phases.setdefault('transfer', [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+            self.counters['bytes_transferred'] = self.counters.get('bytes_transferred', 0) + size
+            # Min-heap, so the fastest of the slowest is the one replaced
+            entry = (seconds, path, size)
+            if len(self.slowest) < self.SLOWEST:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self.started
+        io_finished = read_proc_io()
+        if self.io_started and io_finished:
+            self.io = {
+                'read_syscalls': io_finished['syscr'] - self.io_started['syscr'],
+                'write_syscalls': io_finished['syscw'] - self.io_started['syscw'],
+                'read_bytes': io_finished['rchar'] - self.io_started['rchar'],
+                'write_bytes': io_finished['wchar'] - self.io_started['wchar'],
+            }
+
+    def report(self):
+        """Everything measured, as a JSON-serialisable dict"""
+        with self.lock:
+            return {
+                'wall_seconds': round(self.wall_seconds or 0.0, 4),
+                'phases': {phase: {'seconds': round(seconds, 4), 'count': count}
+                           for phase, (seconds, count) in self.phases.items()},
+                'counters': dict(self.counters),
+                'io': dict(self.io),
+                'slowest_files': [{'path': path, 'bytes': size, 'seconds': round(seconds, 4)}
+                                  for seconds, path, size in sorted(self.slowest, reverse=True)],
+            }
+
+
+class ProgressCounter:
+    """
+    Progress shared between the transfer threads and the UI. Workers only
+    bump counters under a lock; the UI polls snapshot() at a fixed rate,
+    so the Tk event queue sees the same number of updates however many
+    files go by.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.discovered = 0
+        self.discovered_bytes = 0
+        self.done = 0
+        self.done_bytes = 0
+        self.scanning = True
+        self.current = ''
+
+    def add_discovered(self, size):
+        with self.lock:
+            self.discovered += 1
+            self.discovered_bytes += size
+
+    def add_bytes(self, filename, size):
+        """Bytes of a file still being copied; add_done later counts the rest"""
+        with self.lock:
+            self.done_bytes += size
+            self.current = filename
+
+    def add_done(self, filename, size, counted=0):
+        with self.lock:
+            self.done += 1
+            self.done_bytes += size - counted
+            self.current = filename
+
+    def finish_scan(self):
+        with self.lock:
+            self.scanning = False
+
+    def snapshot(self):
+        """Counters plus rates and a byte-based ETA, as a dict"""
+        with self.lock:
+            snapshot = {
+                'discovered': self.discovered,
+                'discovered_bytes': self.discovered_bytes,
+                'done': self.done,
+                'done_bytes': self.done_bytes,
+                'scanning': self.scanning,
+                'current': self.current,
+            }
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        snapshot['elapsed'] = elapsed
+        snapshot['files_per_second'] = snapshot['done'] / elapsed
+        snapshot['bytes_per_second'] = snapshot['done_bytes'] / elapsed
+        
+        # Sizes vary too much for file counts to predict the remaining time
+        remaining = snapshot['discovered_bytes'] - snapshot['done_bytes']
+        if snapshot['bytes_per_second'] > 0 and not snapshot['scanning']:
+            snapshot['eta'] = remaining / snapshot['bytes_per_second']
+        else:
+            snapshot['eta'] = None
+        if snapshot['discovered_bytes']:
+            snapshot['percent'] = int(snapshot['done_bytes'] * 100 / snapshot['discovered_bytes'])
+        elif snapshot['discovered']:
+            snapshot['percent'] = int(snapshot['done'] * 100 / snapshot['discovered'])
+        else:
+            snapshot['percent'] = 0
+        return snapshot
+
+
+class MatchProducer(threading.Thread):
+    """
+    Runs the scan and match stages in the background and feeds the
+    matches through a bounded queue, so transfers start as soon as the
+    first file is found and memory does not grow with the source size.
+    """
+    QUEUE_SIZE = 1000
+    _DONE = object()
+
+    def __init__(self, matches, is_cancelled, progress):
+        super().__init__(daemon=True)
+        self.matches = matches
+        self.is_cancelled = is_cancelled
+        self.progress = progress
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.discovered = 0
+        self.error = None
+
+    def run(self):
+        try:
+            for item in self.matches:
+                if not self._put(item):
+                    return
+                self.discovered += 1
+                self.progress.add_discovered(item.size)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.progress.finish_scan()
+            self._put(self._DONE)
+
+    def _put(self, item):
+        """Block until there is room in the queue; False if cancelled"""
+        while not self.is_cancelled():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        """Yield queued matches until the scan finishes or is cancelled"""
+        while not self.is_cancelled():
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is self._DONE:
+                return
+            yield item
+
+
+# Bytes hashed from each end of a file before deciding to hash all of it
+DEDUP_CHUNK = 64 * 1024
+
+
+def quick_digest(path, size):
+    """Hash of a file's size and its first and last DEDUP_CHUNK bytes"""
+    digest = hashlib.blake2b(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(DEDUP_CHUNK))
+        if size > DEDUP_CHUNK:
+            f.seek(max(size - DEDUP_CHUNK, DEDUP_CHUNK))
+            digest.update(f.read(DEDUP_CHUNK))
+    return digest.digest()
+
+
+def full_digest(path):
+    """Hash of a file's whole content, read in 1 MB chunks"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class DestinationFolder:
+    """
+    One destination folder for the duration of a run. It is created (or
+    verified) and listed once, and kept open as a directory handle so
+    later creates and renames resolve relative to it instead of walking
+    the full path again.
+
+    Every name handed out is remembered along with the next counter to try
+    for each filename, so resolving a duplicate needs no filesystem calls.
+    Names still follow the base_N.ext scheme.
+    """
+    USE_DIR_FD = (hasattr(os, 'O_DIRECTORY') and os.open in os.supports_dir_fd
+                  and os.scandir in os.supports_fd)
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.next_counter = {}
+        self.dir_fd = None
+        
+        # Sizes and hashes of files here, loaded the first time
+        # find_identical is used. The lock only guards these caches; files
+        # are hashed outside it, each at most once, and a worker needing
+        # a hash that is being computed waits for that result
+        self.content_lock = threading.Lock()
+        self.sizes = None
+        self.digests = {}
+        
+        os.makedirs(path, exist_ok=True)
+        if self.USE_DIR_FD:
+            self.dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        with os.scandir(path if self.dir_fd is None else self.dir_fd) as entries:
+            self.names = {entry.name for entry in entries}
+
+    def close(self):
+        if self.dir_fd is not None:
+            os.close(self.dir_fd)
+            self.dir_fd = None
+
+    def claim(self, name):
+        """Take a specific name, e.g. one planned by an interrupted run"""
+        with self.lock:
+            self.names.add(name)
+            return name
+
+    def reserve(self, filename):
+        """Return a name for filename that nobody else has been given"""
+        with self.lock:
+            if filename not in self.names:
+                self.names.add(filename)
+                return filename
+            
+            base, ext = os.path.splitext(filename)
+            counter = self.next_counter.get(filename, 1)
+            while f"{base}_{counter}{ext}" in self.names:
+                counter += 1
+            new_filename = f"{base}_{counter}{ext}"
+            self.names.add(new_filename)
+            self.next_counter[filename] = counter + 1
+            return new_filename
+
+    def find_identical(self, src, size):
+        """
+        Name of a file in this folder with the same content as src, or
+        None. Candidates are narrowed by size, then by a hash of both ends,
+        and only then compared by a hash of the whole file.
+        """
+        with self.content_lock:
+            loaded = self.sizes is not None
+        if not loaded:
+            sizes = {}
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        sizes.setdefault(entry.stat().st_size, set()).add(entry.name)
+            with self.content_lock:
+                if self.sizes is None:
+                    self.sizes = sizes
+                else:
+                    # Another worker got there first; keep what it added since
+                    for file_size, names in sizes.items():
+                        self.sizes.setdefault(file_size, set()).update(names)
+        
+        with self.content_lock:
+            candidates = sorted(self.sizes.get(size, ()))
+        if not candidates:
+            return None
+        src_digests = [quick_digest(src, size), None]
+        for name in candidates:
+            try:
+                if self._digest(name, size, 0) != src_digests[0]:
+                    continue
+                if size <= 2 * DEDUP_CHUNK:
+                    # The quick hash already covered the whole file
+                    return name
+                if src_digests[1] is None:
+                    src_digests[1] = full_digest(src)
+                if self._digest(name, size, 1) == src_digests[1]:
+                    return name
+            except OSError:
+                with self.content_lock:
+                    self.sizes.get(size, set()).discard(name)
+        return None
+
+    def _digest(self, name, size, which):
+        """Cached quick (0) or full (1) hash of a file in this folder"""
+        with self.content_lock:
+            digests = self.digests.setdefault(name, [None, None])
+            future = digests[which]
+            owner = future is None
+            if owner:
+                future = digests[which] = Future()
+        if not owner:
+            # Raises the OSError the hashing worker ran into, if any
+            return future.result()
+        
+        path = os.path.join(self.path, name)
+        try:
+            future.set_result(quick_digest(path, size) if which == 0 else full_digest(path))
+        except BaseException as e:
+            future.set_exception(e)
+        return future.result()
+
+    def add_file(self, name, size):
+        """Make a file written by this run a candidate for find_identical"""
+        with self.content_lock:
+            if self.sizes is not None:
+                self.sizes.setdefault(size, set()).add(name)
+
+
+class TransferPool:
+    """
+    Fixed set of worker threads that run transfer(task) for every task in
+    each submitted batch. Tasks still queued when the run is cancelled are
+    dropped without being transferred.
+    """
+    _STOP = object()
+
+    def __init__(self, workers, transfer, is_cancelled):
+        self.transfer = transfer
+        self.is_cancelled = is_cancelled
+        self.queue = queue.Queue(maxsize=workers * 4)
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            batch = self.queue.get()
+            if batch is self._STOP:
+                return
+            for task in batch:
+                if self.is_cancelled():
+                    break
+                self.transfer(task)
+
+    def submit(self, batch):
+        """Queue a list of tasks, waiting for a free slot; False if cancelled"""
+        while not self.is_cancelled():
+            try:
+                self.queue.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def join(self):
+        """Wait for every queued task to finish and stop the workers"""
+        for _ in self.threads:
+            self.queue.put(self._STOP)
+        for thread in self.threads:
+            thread.join()
+
+
+class CopyCancelled(Exception):
+    """Raised by FileCopier.copy when the run is cancelled halfway through a file"""
+
+
+class FileCopier:
+    """
+    Copies file data and metadata the way shutil.copy2 does, but on Linux
+    tries in-kernel mechanisms first: a reflink clone (FICLONE), then
+    os.copy_file_range, then os.sendfile. A mechanism that turns out to be
+    unsupported between two devices is not tried again for that pair.
+    Anything else falls back to a buffered read/write loop.
+
+    Data is written to a temp name next to dst and renamed into place
+    once complete, so a file under its final name is always whole. The
+    copy goes in chunks; between chunks it reports progress and checks
+    for cancellation.
+    """
+    FICLONE = 0x40049409
+    METHODS = ('reflink', 'copy_file_range', 'sendfile')
+    BUFFER_SIZE = 1024 * 1024
+    # Bytes per in-kernel copy call: small enough to cancel a huge file
+    # within a fraction of a second, large enough to cost nothing
+    CHUNK_SIZE = 64 * 1024 * 1024
+    TEMP_SUFFIX = '.organizer.part'
+    # Errors meaning "this mechanism does not work here", not "copy failed"
+    UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.ENOTTY,
+                          errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+
+    def __init__(self):
+        self.unsupported = set()
+        self.kernel_copy = sys.platform.startswith('linux')
+
+    @classmethod
+    def temp_name(cls, name):
+        """Name a copy to name is written under until it is complete"""
+        if len(os.fsencode(name)) > 200:
+            # Keep within the 255 byte limit of most filesystems
+            name = hashlib.blake2b(os.fsencode(name), digest_size=16).hexdigest()
+        return '.' + name + cls.TEMP_SUFFIX
+
+    def copy(self, src, dst, dst_dir_fd=None, on_progress=None, is_cancelled=None):
+        """
+        Copy src to a new file dst and return the name of the method used.
+        dst is never overwritten: if it already exists this raises
+        FileExistsError. With dst_dir_fd, dst is created by name relative
+        to that open directory. on_progress(bytes) is called as data is
+        copied; when is_cancelled() turns true, the temp file is removed
+        and CopyCancelled raised.
+        """
+        binary = getattr(os, 'O_BINARY', 0)
+        temp = os.path.join(os.path.dirname(dst), self.temp_name(os.path.basename(dst)))
+        temp_name = temp if dst_dir_fd is None else os.path.basename(temp)
+        src_fd = os.open(src, os.O_RDONLY | binary)
+        try:
+            dst_fd = self._create_temp(temp_name, dst_dir_fd)
+            try:
+                try:
+                    method = self._copy_data(src_fd, dst_fd, on_progress, is_cancelled)
+                finally:
+                    os.close(dst_fd)
+                shutil.copystat(src, temp)
+                rename_no_replace(temp, dst, dst_dir_fd)
+            except BaseException:
+                # Never leave a partial file behind
+                try:
+                    os.unlink(temp_name, dir_fd=dst_dir_fd)
+                except OSError:
+                    pass
+                raise
+        finally:
+            os.close(src_fd)
+        return method
+
+    @staticmethod
+    def _create_temp(temp_name, dst_dir_fd=None):
+        """
+        Open a new temp file for writing. The destination name was just
+        reserved for this copy, so a temp file already there is left over
+        from a run that was killed and is removed. A failure here is never
+        a FileExistsError, which would be taken for a taken destination.
+        """
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        try:
+            return os.open(temp_name, flags, 0o666, dir_fd=dst_dir_fd)
+        except FileExistsError:
+            pass
+        try:
+            os.unlink(temp_name, dir_fd=dst_dir_fd)
+        except FileNotFoundError:
+            pass
+        try:
+            return os.open(temp_name, flags, 0o666, dir_fd=dst_dir_fd)
+        except FileExistsError:
+            raise OSError(errno.EBUSY, "Temp file is in use by another copy", temp_name) from None
+
+    def _copy_data(self, src_fd, dst_fd, on_progress=None, is_cancelled=None):
+        """Copy the contents of src_fd into dst_fd; return the method used"""
+        def advance(size):
+            if on_progress is not None:
+                on_progress(size)
+            if is_cancelled is not None and is_cancelled():
+                raise CopyCancelled()
+        
+        src_stat = os.fstat(src_fd)
+        if self.kernel_copy:
+            devices = (src_stat.st_dev, os.fstat(dst_fd).st_dev)
+            for method in self.METHODS:
+                if (method, devices) in self.unsupported:
+                    continue
+                try:
+                    if getattr(self, '_' + method)(src_fd, dst_fd, src_stat.st_size, advance):
+                        return method
+                except OSError as e:
+                    if e.errno not in self.UNSUPPORTED_ERRORS:
+                        raise
+                # Not supported here: forget about it and start over
+                self.unsupported.add((method, devices))
+                os.ftruncate(dst_fd, 0)
+                os.lseek(src_fd, 0, os.SEEK_SET)
+                os.lseek(dst_fd, 0, os.SEEK_SET)
+        
+        while True:
+            chunk = os.read(src_fd, self.BUFFER_SIZE)
+            if not chunk:
+                return 'read/write'
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(dst_fd, view):]
+            advance(len(chunk))
+
+    def _reflink(self, src_fd, dst_fd, size, advance):
+        import fcntl
+        # Shares the data blocks, so there is nothing to copy in chunks
+        fcntl.ioctl(dst_fd, self.FICLONE, src_fd)
+        advance(size)
+        return True
+
+    def _copy_file_range(self, src_fd, dst_fd, size, advance):
+        if not hasattr(os, 'copy_file_range'):
+            return False
+        return self._copy_loop(os.copy_file_range, src_fd, dst_fd, size, advance)
+
+    def _sendfile(self, src_fd, dst_fd, size, advance):
+        return self._copy_loop(lambda src, dst, count: os.sendfile(dst, src, None, count),
+                               src_fd, dst_fd, size, advance)
+
+    @classmethod
+    def _copy_loop(cls, copy_chunk, src_fd, dst_fd, size, advance):
+        """Call copy_chunk until size bytes are copied; False if it stalls"""
+        copied = 0
+        while copied < size:
+            sent = copy_chunk(src_fd, dst_fd, min(size - copied, cls.CHUNK_SIZE))
+            if sent == 0:
+                # Some filesystems report success without copying anything;
+                # only trust a zero at the very start as "unsupported"
+                if copied == 0:
+                    return False
+                break
+            copied += sent
+            advance(sent)
+        return True
+
+
+def _load_renameat2():
+    """libc's renameat2, or None where it is not available"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    
+    def rename_noreplace(src, dst, dst_dir_fd=None):
+        # AT_FDCWD = -100, RENAME_NOREPLACE = 1; returns 0 or an errno
+        dst_dir = -100 if dst_dir_fd is None else dst_dir_fd
+        if renameat2(-100, src, dst_dir, dst, 1) == 0:
+            return 0
+        return ctypes.get_errno()
+    return rename_noreplace
+
+
+_renameat2 = _load_renameat2()
+
+
+def rename_no_replace(src, dst, dst_dir_fd=None):
+    """
+    Rename src to dst, raising FileExistsError rather than replacing an
+    existing dst. Uses renameat2(RENAME_NOREPLACE) where the kernel and
+    filesystem support it, then link+unlink, and a plain rename only on
+    filesystems without hard links. With dst_dir_fd, dst is renamed into
+    that open directory by name.
+    """
+    dst_name = dst if dst_dir_fd is None else os.path.basename(dst)
+    if _renameat2 is not None:
+        error = _renameat2(os.fsencode(src), os.fsencode(dst_name), dst_dir_fd)
+        if error == 0:
+            return
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP):
+            raise OSError(error, os.strerror(error), src, None, dst)
+    
+    if os.name == 'nt':
+        # Windows never replaces an existing file on rename
+        os.rename(src, dst)
+        return
+    
+    try:
+        os.link(src, dst_name, dst_dir_fd=dst_dir_fd, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK):
+            raise
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst_name, dst_dir_fd=dst_dir_fd)
+        return
+    os.unlink(src)
+
+
+def device_of(path):
+    """st_dev of path, or of its nearest existing parent if it does not exist yet"""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+
+class FileMover:
+    """
+    Moves files with a plain os.rename when source and target are on the
+    same device, and through FileCopier plus unlink when they are not,
+    instead of letting shutil.move find that out again for every file.
+    """
+
+    def __init__(self, source, target, copier):
+        self.copier = copier
+        self.same_device = device_of(source) == device_of(target)
+
+    def move(self, src, dst, dst_dir_fd=None, on_progress=None, is_cancelled=None):
+        """
+        Move src to dst and return the name of the method that was used.
+        on_progress and is_cancelled are passed on to FileCopier.copy.
+        """
+        if self.same_device:
+            try:
+                rename_no_replace(src, dst, dst_dir_fd)
+                return 'rename'
+            except OSError as e:
+                # A mount point somewhere below the source or target
+                if e.errno != errno.EXDEV:
+                    raise
+        
+        if os.path.islink(src):
+            # Move the link itself, as shutil.move does; fails if dst exists
+            os.symlink(os.readlink(src), dst)
+            method = 'symlink'
+        else:
+            method = self.copier.copy(src, dst, dst_dir_fd, on_progress, is_cancelled)
+        os.unlink(src)
+        return method
+
+
+class FileLinker:
+    """
+    Puts a link to the source file in the target instead of its data: a
+    hard link, or a symbolic link to the absolute source path. Hard links
+    cannot cross devices, so when the target is on another device than
+    the source (or a mount point is in between) the file is copied.
+    """
+    # Errors meaning "no hard link possible here" rather than "link failed"
+    NO_HARDLINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+    def __init__(self, mode, source, target, copier):
+        self.mode = mode
+        self.copier = copier
+        self.same_device = device_of(source) == device_of(target)
+
+    def link(self, src, dst, dst_dir_fd=None, on_progress=None, is_cancelled=None):
+        """
+        Link src as dst and return the name of the method that was used.
+        Like a copy, this raises FileExistsError rather than replace dst.
+        """
+        dst_name = dst if dst_dir_fd is None else os.path.basename(dst)
+        if self.mode == 'symlink':
+            os.symlink(os.path.abspath(src), dst_name, dir_fd=dst_dir_fd)
+            return 'symlink'
+        
+        if self.same_device:
+            try:
+                os.link(src, dst_name, dst_dir_fd=dst_dir_fd, follow_symlinks=False)
+                return 'hardlink'
+            except OSError as e:
+                if e.errno not in self.NO_HARDLINK_ERRORS:
+                    raise
+        method = self.copier.copy(src, dst, dst_dir_fd, on_progress, is_cancelled)
+        return f"{method} (no hardlink possible)"
+
+
+# Temporary download/editor names; the finished file arrives under its real name
+PARTIAL_SUFFIXES = ('.part', '.partial', '.crdownload', '.download', '.tmp', '.temp', '.swp')
+
+
+def is_partial_name(name):
+    """True for names of files that are still being written by another program"""
+    return name.lower().endswith(PARTIAL_SUFFIXES) or name.startswith(('~$', '.~lock.'))
+
+
+def _load_inotify():
+    """(inotify_init1, inotify_add_watch) from libc, or None where they are not available"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        init1 = libc.inotify_init1
+        add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    init1.argtypes = [ctypes.c_int]
+    init1.restype = ctypes.c_int
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    add_watch.restype = ctypes.c_int
+    
+    def checked(result):
+        if result < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return result
+    return (lambda flags: checked(init1(flags)),
+            lambda fd, path, mask: checked(add_watch(fd, os.fsencode(path), mask)))
+
+
+_inotify = _load_inotify()
+
+
+class FolderWatcher:
+    """
+    Reports files in a folder tree once they are finished, debounced into
+    batches: a file is reported after QUIET_SECONDS without new events for
+    it. Folders a FolderFilter prune excludes (the target and destination
+    folders among them) are not watched, and the tool's own files and
+    partial download names are never reported, so the watcher does not
+    react to its own transfers.
+
+    Subclasses supply _wait_events(timeout), which returns the paths that
+    were (re)written since the last call. Files found by listing a folder
+    instead (a new subfolder, lost events) may still be being written, so
+    they are only reported once their size and mtime have not changed for
+    SETTLE_SECONDS, or sooner if an event for them comes in.
+    """
+    QUIET_SECONDS = 0.5
+    SETTLE_SECONDS = 2.0
+
+    def __init__(self, source, include_subfolders, prune=None):
+        self.source = os.path.abspath(source)
+        self.include_subfolders = include_subfolders
+        self.prune = prune
+        self.stopped = threading.Event()
+        self.pending = {}
+        # path -> ((size, mtime_ns), when it last changed)
+        self.settling = {}
+        self.next_settle_check = 0.0
+
+    def ignored(self, path):
+        name = os.path.basename(path)
+        return name in INTERNAL_FILES or is_partial_name(name)
+
+    def folder_excluded(self, entry):
+        return self.prune is not None and self.prune.excluded(entry)
+
+    def stop(self):
+        self.stopped.set()
+
+    def close(self):
+        pass
+
+    def next_batch(self, timeout):
+        """Paths that have been quiet for QUIET_SECONDS; [] after timeout or stop()"""
+        deadline = time.monotonic() + timeout
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            ready = [path for path, seen in self.pending.items() if now - seen >= self.QUIET_SECONDS]
+            for path in ready:
+                del self.pending[path]
+            if self.settling and now >= self.next_settle_check:
+                ready.extend(self._settled(now))
+                self.next_settle_check = now + self.QUIET_SECONDS
+            if ready:
+                return ready
+            
+            wait = deadline - now
+            if self.pending:
+                wait = min(wait, self.QUIET_SECONDS - (now - min(self.pending.values())))
+            if self.settling:
+                wait = min(wait, self.next_settle_check - now)
+            if wait <= 0 and now >= deadline:
+                break
+            for path in self._wait_events(max(wait, 0.01)):
+                if not self.ignored(path):
+                    # Finished writing: no need to wait for it to settle
+                    self.settling.pop(path, None)
+                    self.pending[path] = time.monotonic()
+        return []
+
+    def _add_settling(self, paths):
+        """Report paths once they stop changing, as they may still be written to"""
+        now = time.monotonic()
+        for path in paths:
+            if self.ignored(path) or path in self.pending:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self.settling[path] = ((stat.st_size, stat.st_mtime_ns), now)
+
+    def _settled(self, now):
+        """Settling paths unchanged for SETTLE_SECONDS, which are then no longer watched"""
+        settled = []
+        for path, (stamp, since) in list(self.settling.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.settling[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != stamp:
+                self.settling[path] = (current, now)
+            elif now - since >= self.SETTLE_SECONDS:
+                del self.settling[path]
+                settled.append(path)
+        return settled
+
+    def _files_under(self, folder):
+        """Every file already in a folder that appeared while watching"""
+        try:
+            return [entry.path for entry in iter_source_files(folder, self.include_subfolders, prune=self.prune)]
+        except OSError:
+            return []
+
+
+class InotifyWatcher(FolderWatcher):
+    """FolderWatcher driven by Linux inotify close-after-write and moved-in events"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, source, include_subfolders, prune=None):
+        super().__init__(source, include_subfolders, prune)
+        if _inotify is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = _inotify[0](self.IN_NONBLOCK | self.IN_CLOEXEC)
+        self.folders = {}
+        try:
+            self._add_tree(self.source)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def close(self):
+        os.close(self.fd)
+
+    def _add_watch(self, folder):
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO
+        if self.include_subfolders:
+            mask |= self.IN_CREATE
+        wd = _inotify[1](self.fd, folder, mask)
+        self.folders[wd] = folder
+
+    def _add_tree(self, folder):
+        """Watch folder and, with subfolders included, every folder below it"""
+        self._add_watch(folder)
+        if not self.include_subfolders:
+            return
+        pending = [folder]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and not self.folder_excluded(entry):
+                            try:
+                                self._add_watch(entry.path)
+                            except OSError:
+                                continue
+                            pending.append(entry.path)
+            except OSError:
+                # A folder that disappeared or became unreadable
+                continue
+
+    def _wait_events(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost; fall back to everything in the tree
+                self._add_settling(self._files_under(self.source))
+                continue
+            if mask & self.IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            path = os.path.join(folder, name)
+            if mask & self.IN_ISDIR:
+                # A new folder: watch it, then pick up what is already in it
+                # once it stops changing (it may be copied in right now)
+                if self.include_subfolders and not self.folder_excluded(PathEntry(path)):
+                    try:
+                        self._add_tree(path)
+                    except OSError:
+                        continue
+                    self._add_settling(self._files_under(path))
+            elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                paths.append(path)
+        return paths
+
+
+class PollingWatcher(FolderWatcher):
+    """
+    FolderWatcher for systems without inotify: rescans the tree every
+    POLL_SECONDS and reports a file once its size and mtime have stayed
+    the same for a whole interval
+    """
+    POLL_SECONDS = 2.0
+
+    def __init__(self, source, include_subfolders, prune=None):
+        super().__init__(source, include_subfolders, prune)
+        # Files already there are handled by the initial pass, not reported
+        self.previous = self._scan()
+        self.reported = dict(self.previous)
+        self.next_poll = time.monotonic() + self.POLL_SECONDS
+
+    def _scan(self):
+        stats = {}
+        try:
+            for entry in iter_source_files(self.source, self.include_subfolders, prune=self.prune):
+                if self.ignored(entry.path):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return stats
+
+    def _wait_events(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if wait > timeout:
+            self.stopped.wait(timeout)
+            return []
+        self.stopped.wait(max(wait, 0))
+        self.next_poll = time.monotonic() + self.POLL_SECONDS
+        
+        current = self._scan()
+        paths = [path for path, stat in current.items()
+                 if stat == self.previous.get(path) and stat != self.reported.get(path)]
+        for path in paths:
+            self.reported[path] = current[path]
+        for path in list(self.reported):
+            if path not in current:
+                del self.reported[path]
+        self.previous = current
+        return paths
+
+
+def open_watcher(source, include_subfolders, prune=None):
+    """An InotifyWatcher where inotify works, else a PollingWatcher"""
+    try:
+        return InotifyWatcher(source, include_subfolders, prune)
+    except OSError:
+        return PollingWatcher(source, include_subfolders, prune)
+
+
+def watch_matches(config, watcher, onerror=None, stats=None):
+    """
+    Yield a MatchedFile for every file already in the source, then for
+    each finished file the watcher reports, until it is stopped. A file
+    reported again without changes (e.g. reopened and closed) is skipped.
+    """
+    handled = {}
+    for item in iter_matches(config, onerror, stats=stats):
+        try:
+            stat = os.stat(item.path)
+            handled[item.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        yield item
+    
+    rules = config['rules']
+    while not watcher.stopped.is_set():
+        for path in watcher.next_batch(timeout=0.5):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Gone again, e.g. a download that was cancelled
+                continue
+            if handled.get(path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            handled[path] = (stat.st_size, stat.st_mtime_ns)
+            name = os.path.basename(path)
+            facts = FileFacts(PathEntry(path, stat), config['source']) if rules.needs_facts else None
+            rule = rules.match(name, facts)
+            if rule is not None:
+                yield MatchedFile(path, name, rule.folder_name, stat.st_size)
+
+
+def check_thread_counts(workers, scan_threads):
+    """Raise ValueError unless both thread counts are within 1..MAX_WORKERS"""
+    if not 1 <= workers <= MAX_WORKERS:
+        raise ValueError(f"Workers must be a number from 1 to {MAX_WORKERS}")
+    if not 1 <= scan_threads <= MAX_WORKERS:
+        raise ValueError(f"Scan threads must be a number from 1 to {MAX_WORKERS}")
+
+
+def make_config(source, target, pairs, mode='copy', include_subfolders=True, skip_hidden=True, exclude=(),
+                incremental=False, dedup='off', workers=DEFAULT_WORKERS, scan_threads=DEFAULT_SCAN_THREADS):
+    """
+    Check run settings and return them as the config dict the engine
+    takes. Raises ValueError with a message fit for the user.
+    """
+    if not source:
+        raise ValueError("Please select a source folder")
+    if not os.path.exists(source):
+        raise ValueError(f"Source folder does not exist:\n{source}")
+    if not os.path.isdir(source):
+        raise ValueError("Source path must be a directory")
+    # The journal and the incremental index keep these paths, and a later
+    # run or resume may start from another working directory
+    source = os.path.abspath(source)
+    target = os.path.abspath(target or source)
+
+    if not pairs:
+        raise ValueError("Please enter at least one keyword and folder name pair")
+    if mode not in MODES:
+        raise ValueError(f"Unknown operation mode: {mode}")
+    if dedup not in ('off', 'skip', 'hardlink'):
+        raise ValueError(f"Unknown identical file handling: {dedup}")
+    check_thread_counts(workers, scan_threads)
+
+    # Check every rule up front so all mistakes are reported at once
+    problems = check_rules(pairs)
+    if problems:
+        raise ValueError(f"Invalid rules:\n{describe_rule_problems(problems)}")
+    rules = RuleIndex(compile_rules(pairs))
+
+    # Never walk into already sorted files, the target or excluded folders
+    exclude = list(exclude)
+    prune = FolderFilter(source, target, [folder for _, folder in pairs], skip_hidden, exclude)
+
+    return {
+        'source': source,
+        'target': target,
+        'pairs': list(pairs),
+        'rules': rules,
+        'mode': mode,
+        'include_subfolders': include_subfolders,
+        'skip_hidden': skip_hidden,
+        'exclude': exclude,
+        'prune': prune,
+        'incremental': incremental,
+        'dedup': dedup if mode == 'copy' else 'off',
+        'workers': workers,
+        'scan_threads': scan_threads
+    }
+
+
+def load_rules(path):
+    """
+    Read keyword/folder pairs from a rules file: JSON (a list of
+    [keyword, folder] pairs or {"keyword": ..., "folder": ...} objects)
+    or CSV with the folder in the last column. In CSV, blank lines, lines
+    starting with # and a keyword,folder header row are skipped, and an
+    unquoted keyword may contain commas (ext:jpg,png). Quotes in a
+    hand-written keyword are kept for the keyword syntax (see
+    _split_rule_line). Raises ValueError if the file cannot be read as
+    rules; check_rules finds bad ones.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        text = f.read()
+
+    if path.lower().endswith('.json'):
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"{path}: not valid JSON ({str(e)})")
+        if isinstance(data, dict):
+            data = data.get('rules')
+        if not isinstance(data, list):
+            raise ValueError(f"{path}: expected a list of rules")
+        rows = []
+        for number, rule in enumerate(data, 1):
+            if isinstance(rule, dict):
+                rule = [rule.get('keyword'), rule.get('folder')]
+            if not isinstance(rule, (list, tuple)) or len(rule) != 2:
+                raise ValueError(f"{path}: rule {number} must be a keyword and a folder")
+            rows.append((number, list(rule)))
+    else:
+        rows = [(number, _split_rule_line(line)) for number, line in enumerate(text.splitlines(), 1)
+                if line.strip() and not line.lstrip().startswith('#')]
+        if rows and [cell.strip().lower() for cell in rows[0][1]] == ['keyword', 'folder']:
+            rows = rows[1:]
+
+    pairs = []
+    for number, row in rows:
+        if not all(isinstance(cell, str) for cell in row):
+            raise ValueError(f"{path}: rule {number} must be a keyword and a folder")
+        if len(row) < 2:
+            row = row + ['']
+        pairs.append((','.join(row[:-1]).strip(), row[-1].strip()))
+    return pairs
+
+
+def _split_rule_line(line):
+    """
+    Cells of one line of a CSV rules file. A line exactly as csv.writer
+    (and so save_rules) would write it is read as CSV; any other line is
+    hand-written and split on its last comma, so that "(1)" * photo keeps
+    the quotes that make (1) literal instead of losing them to CSV.
+    """
+    try:
+        row = next(csv.reader([line], strict=True))
+    except csv.Error:
+        return line.rsplit(',', 1)
+    written = io.StringIO()
+    csv.writer(written, lineterminator='').writerow(row)
+    if written.getvalue() == line:
+        return row
+    return line.rsplit(',', 1)
+
+
+def save_rules(path, pairs):
+    """Write keyword/folder pairs as JSON or CSV, by the extension of path"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            json.dump([{'keyword': keyword, 'folder': folder_name} for keyword, folder_name in pairs],
+                      f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        else:
+            writer = csv.writer(f)
+            writer.writerow(['keyword', 'folder'])
+            writer.writerows(pairs)
+
+
+# How a run ended: status is 'completed', 'cancelled', 'scan_failed',
+# 'no_matches' or 'nothing_new'; error is set when the scan failed
+RunOutcome = namedtuple('RunOutcome', ['status', 'log', 'error'])
+
+
+def run_operation(config, progress, is_cancelled, plan=None, resume=None, watcher=None):
+    """
+    Perform the actual file operations, from a previewed plan or the
+    journal of an interrupted run if given. With a watcher, keep
+    transferring the files it reports until it is stopped. Returns a
+    RunOutcome; progress is reported through the ProgressCounter.
+    """
+    # With no workers nothing would be transferred, yet the journal of
+    # the run would be removed as if everything had been
+    if config['workers'] < 1:
+        raise ValueError("Workers must be at least 1")
+    operation_log = {
+        'success': {},
+        'errors': [],
+        'skipped': [],
+        'transfer_methods': {},
+        'unchanged_skipped': 0,
+        'dedup': config['dedup'],
+        'duplicates': [],
+        'duplicate_bytes': 0,
+        'stats': None,
+        'rule_hits': [],
+        'total_processed': 0
+    }
+    stats = RunStats()
+    log_lock = threading.Lock()
+    # A previewed plan was matched with its own copy of the rules
+    rules = plan.rules if plan is not None else config['rules']
+
+    def log_success(folder_name, method):
+        with log_lock:
+            methods = operation_log['transfer_methods']
+            methods[method] = methods.get(method, 0) + 1
+            if folder_name not in operation_log['success']:
+                operation_log['success'][folder_name] = 0
+            operation_log['success'][folder_name] += 1
+            operation_log['total_processed'] += 1
+
+    def log_duplicate(item, identical):
+        with log_lock:
+            operation_log['duplicates'].append(f"{item.name} = {item.folder}/{identical}")
+            operation_log['duplicate_bytes'] += item.size
+
+    # Scan and match in the background while files are transferred
+    scan_errors = operation_log['errors']
+    skipped = operation_log['skipped']
+    onmissing = lambda path, e: skipped.append(f"{path}: {e.strerror}")
+    index = None
+    if resume is not None:
+        journal = RunJournal(config['target'])
+        journal.next_id = max(resume.plans, default=-1) + 1
+
+        def on_finished(planned):
+            # Transferred before the interruption, but never marked done
+            journal.record_done(planned['id'])
+            log_success(planned['folder'], 'completed before interruption')
+        matches = resume.iter_remaining(config, on_finished, onmissing,
+                                        onerror=lambda e: scan_errors.append(str(e)))
+    else:
+        journal = RunJournal(config['target'], header={
+            'mode': config['mode'], 'source': config['source'], 'target': config['target'],
+            'pairs': config['pairs'], 'include_subfolders': config['include_subfolders'],
+            'skip_hidden': config['skip_hidden'], 'exclude': config['exclude'],
+            'dedup': config['dedup']})
+        if watcher is not None:
+            matches = watch_matches(config, watcher, onerror=lambda e: scan_errors.append(str(e)),
+                                    stats=stats)
+        elif plan is not None:
+            scan_errors.extend(plan.scan_errors)
+            stats.add('scan + match (preview)', plan.seconds, len(plan))
+            index = plan.index
+            matches = plan.iter_existing(onmissing)
+        else:
+            if config['incremental']:
+                try:
+                    index = IncrementalIndex(config)
+                except (sqlite3.Error, OSError) as e:
+                    scan_errors.append(f"Incremental index unavailable, scanning everything: {str(e)}")
+            matches = iter_matches(config, onerror=lambda e: scan_errors.append(str(e)), index=index,
+                                   stats=stats)
+    producer = MatchProducer(matches, is_cancelled, progress)
+    producer.start()
+
+    copier = FileCopier()
+    mover = FileMover(config['source'], config['target'], copier) if config['mode'] == 'move' else None
+    linker = None
+    if config['mode'] in ('hardlink', 'symlink'):
+        linker = FileLinker(config['mode'], config['source'], config['target'], copier)
+
+    def finish_file(item, error=None, counted=0):
+        if error is not None:
+            with log_lock:
+                operation_log['errors'].append(f"{item.name}: {str(error)}")
+            if index is not None:
+                index.mark_dirty(item.path)
+        progress.add_done(item.name, item.size, counted)
+
+    def transfer(task):
+        item, dest_folder, dest_name = task
+        counted = 0
+
+        def on_progress(size):
+            nonlocal counted
+            counted += size
+            progress.add_bytes(item.name, size)
+        try:
+            identical = None
+            if config['dedup'] != 'off':
+                with stats.timed('dedup'):
+                    identical = dest_folder.find_identical(item.path, item.size)
+                if identical is not None and config['dedup'] == 'skip':
+                    log_duplicate(item, identical)
+                    journal.record_done(item.op_id)
+                    if index is not None:
+                        index.record_done(item.path)
+                    finish_file(item)
+                    return
+
+            start = time.perf_counter()
+            while True:
+                dest_path = os.path.join(dest_folder.path, dest_name)
+                try:
+                    # Perform operation
+                    if identical is not None:
+                        try:
+                            os.link(os.path.join(dest_folder.path, identical), dest_path)
+                            method = 'hardlink to identical file'
+                            log_duplicate(item, identical)
+                            break
+                        except FileExistsError:
+                            raise
+                        except OSError:
+                            # No hardlinks here; copy after all
+                            identical = None
+                    if config['mode'] == 'copy':
+                        method = copier.copy(item.path, dest_path, dest_folder.dir_fd, on_progress, is_cancelled)
+                    elif mover is not None:
+                        method = mover.move(item.path, dest_path, dest_folder.dir_fd, on_progress, is_cancelled)
+                    else:
+                        method = linker.link(item.path, dest_path, dest_folder.dir_fd, on_progress, is_cancelled)
+                    break
+                except FileExistsError:
+                    # Created by someone else since the folder was listed;
+                    # the new name must be on record before it is used
+                    stats.count('collisions_at_transfer')
+                    dest_name = dest_folder.reserve(item.name)
+                    journal.record_plan(item, dest_name, item.op_id)
+                    journal.flush()
+        except CopyCancelled:
+            # The temp file is gone and the journal still has the transfer
+            # as planned, so Resume redoes it
+            if index is not None:
+                index.mark_dirty(item.path)
+            return
+        except Exception as e:
+            finish_file(item, e, counted)
+            return
+
+        # Log success
+        stats.add_transfer(item.path, item.size, time.perf_counter() - start)
+        if config['dedup'] != 'off':
+            dest_folder.add_file(dest_name, item.size)
+        journal.record_done(item.op_id)
+        if index is not None and config['mode'] != 'move':
+            index.record_done(item.path)
+        log_success(item.folder, method)
+        finish_file(item, counted=counted)
+
+    # Same-device renames and links are cheap enough that per-file
+    # queue handoffs would dominate, so hand them out in batches; when
+    # watching, files arrive a few at a time and go out right away
+    metadata_only = ((mover is not None and mover.same_device)
+                     or (linker is not None and (linker.mode == 'symlink' or linker.same_device)))
+    batch_size = 256 if metadata_only and watcher is None else 1
+    batch = []
+
+    # Destination names are chosen here, in discovery order, so
+    # duplicate naming does not depend on which worker runs first
+    dest_folders = {}
+    pool = TransferPool(config['workers'], transfer, is_cancelled)
+    try:
+        for item in producer:
+            # Create destination folder once per run (auto-create if doesn't exist)
+            dest_folder = dest_folders.get(item.folder)
+            if dest_folder is None:
+                try:
+                    with stats.timed('mkdir'):
+                        dest_folder = DestinationFolder(os.path.join(config['target'], item.folder))
+                except OSError as e:
+                    dest_folder = e
+                    with log_lock:
+                        operation_log['errors'].append(f"📁 {item.folder}: {str(e)}")
+                dest_folders[item.folder] = dest_folder
+
+            if isinstance(dest_folder, OSError):
+                # Already reported once for the folder
+                with log_lock:
+                    operation_log['skipped'].append(f"{item.path}: destination folder unavailable")
+                if index is not None:
+                    index.mark_dirty(item.path)
+                finish_file(item)
+                continue
+
+            # Handle duplicate filenames
+            with stats.timed('collisions'):
+                if item.dest_name is not None:
+                    dest_name = dest_folder.claim(item.dest_name)
+                else:
+                    dest_name = dest_folder.reserve(item.name)
+            if dest_name != item.name:
+                stats.count('renamed')
+            if item.dest_name is None:
+                # New, or resumed under a fresh name
+                with stats.timed('journal'):
+                    item = item._replace(op_id=journal.record_plan(item, dest_name, item.op_id))
+            batch.append((item, dest_folder, dest_name))
+            if len(batch) >= batch_size:
+                # Planned transfers must be on record before they start
+                with stats.timed('journal'):
+                    journal.flush()
+                if not pool.submit(batch):
+                    break
+                batch = []
+        else:
+            if batch:
+                journal.flush()
+                pool.submit(batch)
+            if producer.error is None and not is_cancelled():
+                journal.record_scanned()
+    finally:
+        pool.join()
+        for dest_folder in dest_folders.values():
+            if isinstance(dest_folder, DestinationFolder):
+                dest_folder.close()
+
+        # Keep the journal for Resume only if the run was cut short; files
+        # that failed are still in the source, so the next run retries them
+        interrupted = is_cancelled() or producer.error is not None
+        journal.close(remove=not interrupted)
+
+        stats.finish()
+        operation_log['stats'] = stats.report()
+        operation_log['rule_hits'] = list(rules.hits)
+
+        if index is not None:
+            operation_log['unchanged_skipped'] = index.skipped
+            index.commit(walk_complete=not is_cancelled() and producer.error is None)
+            index.close()
+        if watcher is not None:
+            watcher.stop()
+            watcher.close()
+
+    if is_cancelled():
+        return RunOutcome('cancelled', operation_log, None)
+    if producer.error is not None:
+        return RunOutcome('scan_failed', operation_log, producer.error)
+    if producer.discovered == 0 and operation_log['total_processed'] == 0:
+        return RunOutcome('nothing_new' if index is not None else 'no_matches', operation_log, None)
+    return RunOutcome('completed', operation_log, None)
+
+
+# Settings a job in a job file may have besides source and name
+JOB_SETTINGS = {'target', 'rules', 'mode', 'include_subfolders', 'skip_hidden', 'exclude', 'incremental',
+                'dedup', 'workers', 'scan_threads'}
+
+
+class Job:
+    """One source/target run from a job file, and how it ended"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        # What the job reads and writes: disks are shared up to a limit,
+        # folders never (journals and indexes live in them)
+        self.devices = {device_of(config['source']), device_of(config['target'])}
+        self.folders = {os.path.realpath(config['source']), os.path.realpath(config['target'])}
+        self.progress = ProgressCounter()
+        self.outcome = None
+        self.error = None
+
+    def status(self):
+        if self.error is not None:
+            return 'failed'
+        return self.outcome.status if self.outcome is not None else 'not_started'
+
+
+def load_jobs(path):
+    """
+    Read a job file: JSON with a "jobs" list of objects (or just the
+    list), each with a source and any make_config setting, and "rules"
+    as a rules file or a list of [keyword, folder] pairs. A "defaults"
+    object applies to every job and "per_device" sets how many jobs may
+    use one disk at once. Relative paths are relative to the job file.
+    Returns (jobs, per_device); raises ValueError listing every bad job.
+    """
+    with open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"{path}: not valid JSON ({str(e)})")
+    if isinstance(data, list):
+        data = {'jobs': data}
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list) or not data['jobs']:
+        raise ValueError(f"{path}: expected a list of jobs")
+    per_device = data.get('per_device', 1)
+    if not isinstance(per_device, int) or per_device < 1:
+        raise ValueError(f"{path}: per_device must be a whole number of at least 1")
+    defaults = data.get('defaults', {})
+    if not isinstance(defaults, dict):
+        raise ValueError(f"{path}: defaults must be an object")
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(value):
+        return os.path.join(base, os.path.expanduser(value)) if value else value
+
+    jobs = []
+    problems = []
+    for number, entry in enumerate(data['jobs'], 1):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("must be an object")
+            settings = dict(defaults, **entry)
+            unknown = sorted(set(settings) - JOB_SETTINGS - {'source', 'name'})
+            if unknown:
+                raise ValueError(f"unknown setting '{unknown[0]}'")
+            rules = settings.pop('rules', None)
+            if isinstance(rules, str):
+                pairs = load_rules(resolve(rules))
+            elif isinstance(rules, list) and all(isinstance(pair, list) and len(pair) == 2 for pair in rules):
+                pairs = [(str(keyword).strip(), str(folder_name).strip()) for keyword, folder_name in rules]
+            else:
+                raise ValueError("rules must be a rules file or a list of [keyword, folder] pairs")
+            if isinstance(settings.get('exclude'), str):
+                settings['exclude'] = FolderFilter.parse_patterns(settings['exclude'])
+            name = settings.pop('name', None) or f"job {number}"
+            source = resolve(settings.pop('source', None))
+            target = resolve(settings.pop('target', None))
+            jobs.append(Job(name, make_config(source, target, pairs, **settings)))
+        except (OSError, ValueError, TypeError) as e:
+            problems.append(f"Job {number}: {str(e)}")
+    if problems:
+        raise ValueError("\n".join(problems))
+    return jobs, per_device
+
+
+class JobScheduler(threading.Thread):
+    """
+    Runs jobs in the background, in file order as far as the disks allow:
+    a job starts once every device it reads or writes (by st_dev) runs
+    fewer than per_device jobs and no running job uses its folders. Jobs
+    on different disks run side by side; jobs on the same disk take
+    turns instead of fighting over it. on_start(job) and on_finish(job)
+    are called from the job threads.
+    """
+    POLL_SECONDS = 0.1
+
+    def __init__(self, jobs, per_device=1, is_cancelled=lambda: False, on_start=None, on_finish=None):
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.per_device = per_device
+        self.is_cancelled = is_cancelled
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.condition = threading.Condition()
+        self.device_jobs = {}
+        self.busy_folders = set()
+        self.running = []
+
+    def _can_start(self, job):
+        return (all(self.device_jobs.get(device, 0) < self.per_device for device in job.devices)
+                and not job.folders & self.busy_folders)
+
+    def run(self):
+        pending = list(self.jobs)
+        threads = []
+        with self.condition:
+            while pending and not self.is_cancelled():
+                for job in list(pending):
+                    if not self._can_start(job):
+                        continue
+                    pending.remove(job)
+                    for device in job.devices:
+                        self.device_jobs[device] = self.device_jobs.get(device, 0) + 1
+                    self.busy_folders |= job.folders
+                    self.running.append(job)
+                    thread = threading.Thread(target=self._run_job, args=(job,), daemon=True)
+                    thread.start()
+                    threads.append(thread)
+                # Woken when a job finishes; the timeout notices cancellation
+                self.condition.wait(self.POLL_SECONDS)
+        for thread in threads:
+            thread.join()
+
+    def _run_job(self, job):
+        try:
+            if self.on_start is not None:
+                self.on_start(job)
+            if RunJournal.exists(job.config['target']):
+                raise ValueError("An interrupted run was found in the target folder; finish it first")
+            job.outcome = run_operation(job.config, job.progress, self.is_cancelled)
+        except Exception as e:
+            job.error = e
+        finally:
+            with self.condition:
+                for device in job.devices:
+                    self.device_jobs[device] -= 1
+                self.busy_folders -= job.folders
+                self.running.remove(job)
+                self.condition.notify_all()
+            if self.on_finish is not None:
+                self.on_finish(job)
+
+    def running_jobs(self):
+        with self.condition:
+            return list(self.running)
+
+
+# Exit codes of the command line
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_SOURCE_UNREADABLE = 3
+EXIT_INTERRUPTED_RUN = 4
+EXIT_CANCELLED = 130
+
+
+_emit_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    """Write one JSON event line to stdout"""
+    line = json.dumps(dict(event=event, **fields), ensure_ascii=False) + '\n'
+    # Jobs report from their own threads; keep lines whole
+    with _emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def emit_progress(progress, **fields):
+    snapshot = progress.snapshot()
+    emit('progress', **fields, **{key: round(value, 3) if isinstance(value, float) else value
+                                  for key, value in snapshot.items()})
+
+
+def on_stop_signals(handler):
+    """Call handler(signum, frame) on Ctrl+C and, where there is one, SIGTERM"""
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handler)
+
+
+def run_jobs(args):
+    """The --jobs command: run every job of a job file, in parallel across disks"""
+    try:
+        jobs, per_device = load_jobs(args.jobs)
+    except (OSError, ValueError) as e:
+        emit('error', message=str(e))
+        return EXIT_USAGE
+    if args.per_device is not None:
+        per_device = args.per_device
+
+    emit('start', jobs=len(jobs), per_device=per_device)
+    cancelled = threading.Event()
+    on_stop_signals(lambda signum, frame: cancelled.set())
+
+    def on_start(job):
+        emit('job_start', job=job.name, source=job.config['source'], target=job.config['target'],
+             mode=job.config['mode'], rules=len(job.config['pairs']))
+
+    def on_finish(job):
+        fields = dict(job.outcome.log) if job.outcome is not None else {}
+        error = job.error if job.error is not None else job.outcome.error
+        if error is not None:
+            fields['message'] = str(error)
+        emit('job_summary', job=job.name, status=job.status(), **fields)
+
+    scheduler = JobScheduler(jobs, per_device, cancelled.is_set, on_start, on_finish)
+    scheduler.start()
+    while True:
+        scheduler.join(max(args.progress_interval, 0.05))
+        if not scheduler.is_alive():
+            break
+        for job in scheduler.running_jobs():
+            emit_progress(job.progress, job=job.name)
+
+    emit('summary', jobs=[{
+        'job': job.name,
+        'status': job.status(),
+        'processed': job.outcome.log['total_processed'] if job.outcome is not None else 0,
+        'errors': len(job.outcome.log['errors']) if job.outcome is not None else 0,
+    } for job in jobs])
+    statuses = {job.status() for job in jobs}
+    if cancelled.is_set():
+        return EXIT_CANCELLED
+    if 'scan_failed' in statuses:
+        return EXIT_SOURCE_UNREADABLE
+    if 'failed' in statuses or any(job.outcome.log['errors'] for job in jobs if job.outcome is not None):
+        return EXIT_ERRORS
+    return EXIT_OK
+
+
+def main(argv=None):
+    """
+    Command line entry point: sort a folder, or every job of a job file,
+    headlessly, printing one JSON event per line (start, progress, match,
+    job_start, job_summary, summary, error) on stdout.
+    """
+    parser = argparse.ArgumentParser(
+        description="Sort files into folders by keyword rules, without the GUI. "
+                    "Progress is printed as JSON lines on stdout.",
+        epilog="Exit codes: 0 done, 1 done with errors, 2 bad arguments, rules or job file, "
+               "3 source unreadable, 4 an interrupted run must be resumed first, 130 cancelled.")
+    parser.add_argument('source', nargs='?',
+                        help="folder to sort; not needed with --resume and --target, which take it from the journal")
+    parser.add_argument('--target', help="where the keyword folders go (default: the source)")
+    parser.add_argument('--rules', help="CSV or JSON file of keyword/folder pairs")
+    parser.add_argument('--mode', choices=MODES, default='copy',
+                        help="hardlink and symlink leave the data in place and only add links to it")
+    parser.add_argument('--no-subfolders', action='store_true', help="only sort files directly in the source")
+    parser.add_argument('--include-hidden', action='store_true', help="also search hidden and system folders")
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help="folder name or relative path to leave alone; repeatable")
+    parser.add_argument('--incremental', action='store_true', help="skip folders unchanged since the last run")
+    parser.add_argument('--dedup', choices=['off', 'skip', 'hardlink'], default='off',
+                        help="what to do with files identical to one already in the destination (copy only)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--scan-threads', type=int, default=DEFAULT_SCAN_THREADS)
+    parser.add_argument('--progress-interval', type=float, default=1.0, metavar='SECONDS')
+    parser.add_argument('--jobs', metavar='FILE', help="run the jobs of a JSON job file instead of one source")
+    parser.add_argument('--per-device', type=int, metavar='N',
+                        help="with --jobs, how many jobs may use one disk at once (default: from the file, or 1)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--dry-run', action='store_true', help="print the matches without transferring")
+    group.add_argument('--resume', action='store_true',
+                       help="finish the interrupted run in --target (or the source), with its own settings")
+    group.add_argument('--watch', action='store_true', help="keep sorting new files until interrupted")
+    args = parser.parse_args(argv)
+
+    if args.jobs:
+        if args.source or args.dry_run or args.resume or args.watch:
+            parser.error("--jobs cannot be combined with a source, --dry-run, --resume or --watch")
+        if args.per_device is not None and args.per_device < 1:
+            parser.error("--per-device must be at least 1")
+        return run_jobs(args)
+    if not args.source and not (args.resume and args.target):
+        parser.error("a source folder, --resume with --target, or --jobs is required")
+
+    resume = None
+    try:
+        if args.resume:
+            resume = RunJournal.load(args.target or args.source)
+            if resume is None:
+                raise ValueError(f"No interrupted run found in:\n{args.target or args.source}")
+            check_thread_counts(args.workers, args.scan_threads)
+            config = resume.config()
+            config['workers'] = args.workers
+            config['scan_threads'] = args.scan_threads
+        else:
+            if not args.rules:
+                parser.error("--rules is required unless resuming")
+            exclude = [pattern for text in args.exclude for pattern in FolderFilter.parse_patterns(text)]
+            config = make_config(args.source, args.target, load_rules(args.rules), mode=args.mode,
+                                 include_subfolders=not args.no_subfolders, skip_hidden=not args.include_hidden,
+                                 exclude=exclude, incremental=args.incremental, dedup=args.dedup,
+                                 workers=args.workers, scan_threads=args.scan_threads)
+    except (OSError, ValueError, KeyError) as e:
+        emit('error', message=str(e))
+        return EXIT_USAGE
+
+    if not args.resume and not args.dry_run and RunJournal.exists(config['target']):
+        emit('error', message="An interrupted run was found in the target folder; finish it with --resume "
+                              f"or remove {RunJournal.path_for(config['target'])}")
+        return EXIT_INTERRUPTED_RUN
+
+    emit('start', source=config['source'], target=config['target'], mode=config['mode'],
+         rules=len(config['pairs']), dry_run=args.dry_run, resume=args.resume, watch=args.watch)
+
+    if args.dry_run:
+        errors = []
+        matched = 0
+        try:
+            for item in iter_matches(config, onerror=lambda e: errors.append(str(e))):
+                matched += 1
+                emit('match', path=item.path, folder=item.folder, size=item.size)
+        except OSError as e:
+            emit('error', message=f"Error reading source folder:\n{str(e)}")
+            return EXIT_SOURCE_UNREADABLE
+        emit('summary', status='completed' if matched else 'no_matches', matched=matched, errors=errors)
+        return EXIT_ERRORS if errors else EXIT_OK
+
+    watcher = None
+    if args.watch:
+        try:
+            watcher = open_watcher(config['source'], config['include_subfolders'], prune=config['prune'])
+        except OSError as e:
+            emit('error', message=f"Cannot watch the source folder:\n{str(e)}")
+            return EXIT_SOURCE_UNREADABLE
+
+    cancelled = threading.Event()
+
+    def on_signal(signum, frame):
+        if watcher is not None and not watcher.stopped.is_set():
+            # Stop watching, but let transfers already started finish
+            watcher.stop()
+        else:
+            cancelled.set()
+    on_stop_signals(on_signal)
+
+    progress = ProgressCounter()
+    result = {}
+
+    def run():
+        try:
+            result['outcome'] = run_operation(config, progress, cancelled.is_set, resume=resume, watcher=watcher)
+        except Exception as e:
+            result['error'] = e
+
+    # The engine runs in a worker thread so signals and progress are
+    # handled here on the main thread
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    while True:
+        thread.join(max(args.progress_interval, 0.05))
+        if not thread.is_alive():
+            break
+        emit_progress(progress)
+    emit_progress(progress)
+
+    if 'error' in result:
+        emit('error', message=f"Operation failed:\n{str(result['error'])}")
+        return EXIT_ERRORS
+    outcome = result['outcome']
+    emit('summary', status=outcome.status, mode=config['mode'], **outcome.log)
+    if outcome.status == 'cancelled':
+        return EXIT_CANCELLED
+    if outcome.status == 'scan_failed':
+        emit('error', message=f"Error reading source folder:\n{str(outcome.error)}")
+        return EXIT_SOURCE_UNREADABLE
+    return EXIT_ERRORS if outcome.log['errors'] else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())